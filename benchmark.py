@@ -0,0 +1,316 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+BENCHMARK
+
+Time hot paths of imgmap.py, mapimg.py and xcodeimg.py on generated images.
+
+Run all and save results.
+$ benchmark.py -o bench.json
+Compare with old results, exit 1 if a stage is 20% slower.
+$ benchmark.py -o new.json --compare bench.json --threshold 1.2
+Only some fixtures, best of 5 runs.
+$ benchmark.py --fixture sprite --fixture icon -r 5
+
+Fixtures: sprite - two colors 512x512, icon - anti-aliased 1024x1024 with
+hundreds of colors, launch - 2208x2208 launch image.
+Stages: decode, label, serialize, parse, render, resize, encode.
+"""
+
+__version__ = 1.0
+
+# benchmark.py
+
+# MIT License
+# Copyright (c) 2017 Alexander Veledzimovich veledz@gmail.com
+
+# Permission is hereby granted, free of charge, to any person obtaining a
+# copy of this software and associated documentation files (the "Software"),
+# to deal in the Software without restriction, including without limitation
+# the rights to use, copy, modify, merge, publish, distribute, sublicense,
+# and/or sell copies of the Software, and to permit persons to whom the
+# Software is furnished to do so, subject to the following conditions:
+
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING
+# FROM, OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER
+# DEALINGS IN THE SOFTWARE.
+
+import io
+import json
+import os
+import platform
+import random
+import sys
+import time
+from argparse import ArgumentParser
+from tempfile import TemporaryDirectory
+
+from PIL import Image, ImageDraw, ImageFilter
+from PIL import __version__ as pil_version
+
+import imgmap
+import mapimg
+import xcodeimg
+
+try:
+    import resource
+except ImportError:
+    resource = None
+
+FIXTURES = ('sprite', 'icon', 'launch')
+COLORS = [(222, 0, 222, 220), (100, 220, 0, 200)]
+# sizes of one iPhone set for resize and encode
+SIZES = [40, 58, 60, 80, 87, 120, 180, 1024]
+
+
+def make_fixture(name, folder):
+    """
+    make_fixture(name, folder)
+
+    take:
+        name: 'sprite', 'icon' or 'launch'
+        folder: dir for png
+    return:
+        path: path to png, same pixels for every run.
+    """
+    rnd = random.Random(name)
+    if name == 'sprite':
+        img = Image.new('RGBA', (512, 512), (0, 0, 0, 0))
+        draw = ImageDraw.Draw(img)
+        for i in range(40):
+            x, y = rnd.randrange(480), rnd.randrange(480)
+            draw.rectangle((x, y, x + 32, y + 32), fill=(0, 0, 0, 255))
+    elif name == 'icon':
+        img = Image.new('RGBA', (1024, 1024), (255, 255, 255, 255))
+        draw = ImageDraw.Draw(img)
+        for i in range(24):
+            x, y = rnd.randrange(900), rnd.randrange(900)
+            color = tuple(rnd.randrange(256) for i in range(3)) + (255,)
+            draw.ellipse((x, y, x + 120, y + 120), outline=color, width=6)
+        # soft edges give hundreds of colors
+        img = img.filter(ImageFilter.GaussianBlur(1.5))
+        img.putpixel((0, 0), (255, 255, 255, 255))
+    else:
+        img = Image.new('RGB', (2208, 2208), (20, 90, 160))
+        draw = ImageDraw.Draw(img)
+        draw.ellipse((848, 848, 1360, 1360), fill=(250, 200, 0))
+    path = os.path.join(folder, f'{name}.png')
+    img.save(path)
+    return path
+
+
+def peak_rss():
+    """Return peak resident memory of process in KB (0 if unknown)."""
+    if resource is None:
+        return 0
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # bytes on macOS, KB on linux
+    return rss // 1024 if sys.platform == 'darwin' else rss
+
+
+def stage_rss(func):
+    """
+    stage_rss(func)
+
+    take:
+        func: function without args
+    return:
+        KB of peak resident memory added by one run of func (0 if unknown).
+
+    Peak RSS of process only grows, so func runs once more in forked
+    child: peak of child minus RSS of child before func.
+    """
+    if resource is None or not hasattr(os, 'fork'):
+        return 0
+    read, write = os.pipe()
+    pid = os.fork()
+    if not pid:
+        os.close(read)
+        try:
+            start = peak_rss()
+            func()
+            os.write(write, str(peak_rss() - start).encode())
+        finally:
+            os._exit(0)
+    os.close(write)
+    with os.fdopen(read) as file:
+        data = file.read()
+    os.waitpid(pid, 0)
+    return int(data or 0)
+
+
+def measure(func, repeat):
+    """
+    measure(func, repeat)
+
+    take:
+        func: function without args
+        repeat: number of runs
+    return:
+        (best seconds, last result, KB from stage_rss)
+    """
+    best = None
+    for i in range(repeat):
+        start = time.perf_counter()
+        result = func()
+        spent = time.perf_counter() - start
+        best = spent if best is None else min(best, spent)
+    return best, result, stage_rss(func)
+
+
+def bench_fixture(path, repeat):
+    """
+    bench_fixture(path, repeat)
+
+    take:
+        path: path to fixture image
+        repeat: number of runs for every stage
+    return:
+        stages: list of dicts with stage, seconds, throughput, stage_rss_kb.
+    """
+    stages = []
+
+    def add(stage, seconds, amount, unit, memory):
+        stages.append({'stage': stage, 'seconds': round(seconds, 6),
+                       'throughput': round(amount / seconds, 1),
+                       'unit': f'{unit}/s', 'stage_rss_kb': memory})
+
+    def decode():
+        img = Image.open(path)
+        return img.convert('RGBA')
+    seconds, image, memory = measure(decode, repeat)
+    pixels = image.width * image.height
+    add('decode', seconds, pixels, 'px', memory)
+
+    back = imgmap.find_background(image)
+    if back is not None:
+        if imgmap.numpy is not None:
+            seconds, labels, memory = measure(
+                lambda: imgmap._numpy_labels(image, back), repeat)
+        else:
+            seconds, labels, memory = measure(
+                lambda: imgmap._python_labels(image, back), repeat)
+        add('label', seconds, pixels, 'px', memory)
+
+        seconds, frame, memory = measure(
+            lambda: imgmap.pack_matrix(labels), repeat)
+        add('serialize', seconds, len(frame), 'B', memory)
+
+        def parse():
+            stream = io.BufferedReader(io.BytesIO(frame))
+            return next(mapimg.read_matrices(stream))
+        seconds, matrix, memory = measure(parse, repeat)
+        add('parse', seconds, len(frame), 'B', memory)
+
+        seconds, result, memory = measure(
+            lambda: mapimg.matrix_image(matrix, 1, COLORS), repeat)
+        add('render', seconds, pixels, 'px', memory)
+
+    source = Image.open(path)
+    source.load()
+
+    def resize():
+        pyramid = xcodeimg.Pyramid(0)
+        return [xcodeimg.render_image(source, ('size', (i, i)), 'artwork',
+                                      pyramid) for i in SIZES]
+    seconds, resized, memory = measure(resize, repeat)
+    add('resize', seconds, sum(i * i for i in SIZES), 'px', memory)
+
+    def encode():
+        size = 0
+        for i in resized:
+            buffer = io.BytesIO()
+            i.save(buffer, 'PNG')
+            size += buffer.tell()
+        return size
+    seconds, size, memory = measure(encode, repeat)
+    add('encode', seconds, size, 'B', memory)
+    return stages
+
+
+def compare(results, base, threshold):
+    """
+    compare(results, base, threshold)
+
+    take:
+        results: new results
+        base: old results
+        threshold: allowed ratio new/old seconds
+    return:
+        slow: list of 'fixture/stage' slower than threshold.
+    """
+    old = {(i['fixture'], i['stage']): i['seconds'] for i in base['stages']}
+    slow = []
+    for i in results['stages']:
+        key = (i['fixture'], i['stage'])
+        if key in old and old[key] > 0:
+            ratio = i['seconds'] / old[key]
+            mark = ' SLOW' if ratio > threshold else ''
+            print(f'{key[0]:>8} {key[1]:<10} {ratio:6.2f}x{mark}')
+            if ratio > threshold:
+                slow.append('/'.join(key))
+    return slow
+
+
+def main(fixtures=FIXTURES, repeat=3):
+    """
+    main(fixtures=FIXTURES, repeat=3)
+
+    take:
+        fixtures: names of fixtures
+        repeat: number of runs for every stage (best time)
+    return:
+        results: dict for json.
+    """
+    results = {
+        'version': __version__,
+        'time': time.strftime('%Y-%m-%dT%H:%M:%S'),
+        'python': platform.python_version(),
+        'pillow': pil_version,
+        'numpy': getattr(imgmap.numpy, '__version__', None),
+        'machine': platform.platform(),
+        'repeat': repeat,
+        'stages': []
+    }
+    with TemporaryDirectory() as folder:
+        for name in fixtures:
+            path = make_fixture(name, folder)
+            for i in bench_fixture(path, repeat):
+                results['stages'].append(dict(fixture=name, **i))
+                print(f'{name:>8} {i["stage"]:<10} {i["seconds"]:10.4f} s '
+                      f'{i["throughput"]:>14,.0f} {i["unit"]:<5} '
+                      f'{i["stage_rss_kb"]:>9} KB', flush=True)
+    return results
+
+
+if __name__ == '__main__':
+    parser = ArgumentParser(description='Benchmark hot paths.')
+    parser.add_argument('--fixture', action='append', choices=FIXTURES,
+                        help='fixture to run (all by default)')
+    parser.add_argument('-r', '--repeat', type=int, default=3,
+                        help='runs for every stage, best time is saved')
+    parser.add_argument('-o', '--output', help='json file for results')
+    parser.add_argument('--compare', metavar='JSON',
+                        help='old results to compare')
+    parser.add_argument('--threshold', type=float, default=1.2,
+                        help='allowed ratio new/old time')
+    args = parser.parse_args()
+
+    results = main(args.fixture or FIXTURES, args.repeat)
+    if args.output:
+        with open(args.output, 'w') as file:
+            json.dump(results, file, indent=4)
+    if args.compare:
+        with open(args.compare) as file:
+            slow = compare(results, json.load(file), args.threshold)
+        if slow:
+            print('Error: slower', ', '.join(slow))
+            sys.exit(1)
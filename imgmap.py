@@ -6,14 +6,32 @@ MATRIX -> IMAGE.
 
 Use imgmap.py with mapimg.py.
 
+Library: image_labels, image_matrix and matrix_bytes take path, bytes or
+PIL image and return numpy array, list or bytes without files.
+>>> matrix_bytes(image_labels(png_bytes), rle=True)
+
 All image in folder with two colors.
 $ imgmap.py | mapimg.py 222,0,222,220 100,220,0,200
 Args.
 $ imgmap.py test.png | mapimg.py 222,0,222,220
 Stdin.
 $ echo 'test.png' | imgmap.py | mapimg.py 222,0,222,220
-Stdout.
-$ imgmap.py icon.png >> out.txt
+Stdout (binary matrix by default, text with --text).
+$ imgmap.py icon.png >> out.bin
+$ imgmap.py --text icon.png >> out.txt
+Compressed binary matrix.
+$ imgmap.py --zip icon.png | mapimg.py 222,0,222,220
+Runs of numbers (small for images with big background).
+$ imgmap.py --rle icon.png | mapimg.py 222,0,222,220
+Matrices of unchanged images from cache dir (LRU, 512 MB).
+$ imgmap.py --cache ~/.imgmap --cache-size 512 sprites/*.png > out.bin
+Numbers of connected parts (4 or 8 neighbours), -c 1 - parts of shapes.
+$ imgmap.py --components 8 -c 1 sprite.png | mapimg.py 222,0,222,220
+Time of stages as json lines (stderr or file).
+$ imgmap.py --timings - icon.png > out.bin
+Very big image in bands of 512 rows, matrix in memory-mapped file
+(source is decoded whole, only RGBA bands and matrix are bounded).
+$ imgmap.py --tile 512 --memmap /tmp poster.tif | mapimg.py
 """
 
 __version__ = 1.0
@@ -41,101 +59,1007 @@ __version__ = 1.0
 # FROM, OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER
 # DEALINGS IN THE SOFTWARE.
 
-# use black, white or transparent background
+# use solid background (most pixels of border)
 # indexed colors - faster and better, resolution <600 px
 # PNG: trasparent - OK,  white - OK, black - OK, indexed - OK, RGB - BAD
 # BMP: transparent - OK, white - OK, black - OK, indexed - OK, RGB - OK
 # TIFF: transparent - OK, white - OK, black - OK, indexed - OK, RGB - OK
 # JPEG: transparent - NO, white - BAD, black - BAD indexed - NO, RGB - BAD
 
+import hashlib
+import io
+import json
+import zlib
+from argparse import ArgumentParser
+from contextlib import contextmanager
+from array import array
+from functools import partial
 from glob import glob
-from os import path
-from sys import argv, stderr, stdin, stdout
+from itertools import chain, groupby, product
+from multiprocessing import Pool
+from os import (close, getpid, makedirs, path, remove, replace, scandir,
+                utime)
+from os.path import basename, getsize, join
+from shutil import copyfileobj
+from struct import Struct
+from sys import byteorder, stderr, stdin, stdout
+from tempfile import mkstemp
+from threading import Lock
+from time import perf_counter
 
 from PIL import Image
 
-# made tolerance
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+# part of border with one color, else image has no background
+BORDER = 0.5
+
+# binary matrix: header + little-endian uint8/uint16/uint32 numbers
+# magic, version, typecode, flags, width, height, size of data
+# RLE data: numbers of runs, then uint32 lengths of runs (version 2)
+MAGIC = b'IMAP'
+VERSION = 2
+HEADER = Struct('<4sBcBxIII')
+ZLIB = 1
+RLE = 2
+# rows of image in one band for tiled_labels
+TILE = 256
+# size of --cache dir in MB
+CACHE_SIZE = 512
+TOOL = 'imgmap'
+STDERR = stderr
+
+# json lines with timings of stages (--timings), None - off
+_timings = None
+_timings_lock = Lock()
 
 
-def image_matrix(img):
+def set_timings(path):
     """
-    image_matrix(img)
+    set_timings(path)
 
     take:
-        img: PATH to image file
+        path: file for json lines with timings, '-' - stderr, None - off
+    return:
+        None
+    """
+    global _timings
+    with _timings_lock:
+        # old file is closed, stderr stays open
+        if _timings is not None and _timings is not STDERR:
+            _timings.close()
+        if path is None:
+            _timings = None
+        elif path == '-':
+            _timings = STDERR
+        else:
+            _timings = open(path, 'a', buffering=1)
+
+
+@contextmanager
+def timing(stage, **counters):
+    """
+    timing(stage, **counters)
+
+    take:
+        stage: name of stage
+        counters: pixels, colors, bytes, files... (change in with block)
+    return:
+        context manager with dict of counters.
+
+    Write json line with seconds and counters if timings are on.
+    """
+    if _timings is None:
+        yield counters
+        return
+    start = perf_counter()
+    yield counters
+    record = dict(tool=TOOL, stage=stage, pid=getpid(),
+                  seconds=round(perf_counter() - start, 6), **counters)
+    with _timings_lock:
+        _timings.write(json.dumps(record) + '\n')
+
+
+def _median_cut(colors, counts, max_colors):
+    """
+    _median_cut(colors, counts, max_colors)
+
+    Split colors to max_colors boxes by weighted median of the widest
+    channel. Return box number for every color.
+    """
+    if numpy is not None:
+        colors = numpy.array(colors, dtype=numpy.int64).reshape(-1, 4)
+        counts = numpy.array(counts, dtype=numpy.int64)
+
+        def box(members):
+            part = colors[members]
+            widths = (part.max(axis=0) - part.min(axis=0)).tolist()
+            width, channel = max(zip(widths, range(4)))
+            return width, channel, members
+
+        def split(members, channel):
+            order = numpy.argsort(colors[members, channel], kind='stable')
+            members = members[order]
+            total = numpy.cumsum(counts[members[:-1]])
+            cut = int(numpy.searchsorted(total, total[-1] / 2 +
+                                         counts[members[-1]] / 2)) + 1
+            return members, min(cut, len(members) - 1)
+
+        members = numpy.arange(len(colors))
+    else:
+        def box(members):
+            width, channel = max(
+                (max(colors[i][ch] for i in members) -
+                 min(colors[i][ch] for i in members), ch) for ch in range(4))
+            return width, channel, members
+
+        def split(members, channel):
+            members = sorted(members, key=lambda i: colors[i][channel])
+            half = sum(counts[i] for i in members) / 2
+            total = 0
+            for cut, i in enumerate(members[:-1], 1):
+                total += counts[i]
+                if total >= half:
+                    break
+            return members, cut
+
+        members = list(range(len(colors)))
+
+    boxes = [box(members)]
+    while len(boxes) < max_colors:
+        num = max(range(len(boxes)), key=lambda i: boxes[i][0])
+        width, channel, members = boxes[num]
+        if width == 0:
+            break
+        members, cut = split(members, channel)
+        boxes[num] = box(members[:cut])
+        boxes.append(box(members[cut:]))
+
+    if numpy is not None:
+        groups = numpy.empty(len(colors), dtype=numpy.int64)
+        for num, item in enumerate(boxes):
+            groups[item[2]] = num
+        return groups.tolist()
+
+    groups = [0] * len(colors)
+    for num, item in enumerate(boxes):
+        for i in item[2]:
+            groups[i] = num
+    return groups
+
+
+def _near_cells(key, color, cell):
+    # cells with all colors in distance cell / 2 from color
+    return product(*[(k, k - 1 if ch - k * cell < cell / 2 else k + 1)
+                     for k, ch in zip(key, color)])
+
+
+def _leaders(colors, counts, tolerance):
+    """
+    _leaders(colors, counts, tolerance)
+
+    Most frequent free color is main color and takes all free colors in
+    distance <= tolerance. Colors are in grid with cell 2 * tolerance,
+    main color looks only in 16 near cells.
+    Return (groups, main colors).
+    """
+    limit = tolerance ** 2
+    cell = int(tolerance * 2) + 1
+    main = []
+    if numpy is not None:
+        colors = numpy.array(colors, dtype=numpy.int64).reshape(-1, 4)
+        counts = numpy.array(counts, dtype=numpy.int64)
+        keys = colors // cell
+        cell_keys, where = numpy.unique(keys, axis=0, return_inverse=True)
+        where = where.ravel()
+        order = numpy.argsort(where, kind='stable')
+        bounds = numpy.cumsum(numpy.bincount(where))[:-1]
+        grid = dict(zip(map(tuple, cell_keys.tolist()),
+                        numpy.split(order, bounds)))
+
+        groups = numpy.full(len(colors), -1, dtype=numpy.int64)
+        # main colors first, equal counts in scan order
+        for i in numpy.argsort(-counts, kind='stable').tolist():
+            if groups[i] >= 0:
+                continue
+            color = colors[i]
+            near = [grid[j] for j in _near_cells(tuple(keys[i].tolist()),
+                                                 color.tolist(), cell)
+                    if j in grid]
+            free = numpy.concatenate(near) if len(near) > 1 else near[0]
+            free = free[groups[free] < 0]
+            dist = ((colors[free] - color) ** 2).sum(axis=1)
+            groups[free[dist <= limit]] = len(main)
+            main.append(tuple(color.tolist()))
+        return groups.tolist(), main
+
+    grid = dict()
+    for i, color in enumerate(colors):
+        grid.setdefault(tuple(ch // cell for ch in color), []).append(i)
+    groups = [-1] * len(colors)
+    for i in sorted(range(len(colors)), key=lambda i: counts[i],
+                    reverse=True):
+        if groups[i] >= 0:
+            continue
+        color = colors[i]
+        key = tuple(ch // cell for ch in color)
+        for near in _near_cells(key, color, cell):
+            free = []
+            for j in grid.get(near, ()):
+                dist = sum((x - y) ** 2 for x, y in zip(color, colors[j]))
+                if dist <= limit:
+                    groups[j] = len(main)
+                else:
+                    free.append(j)
+            if near in grid:
+                grid[near] = free
+        main.append(tuple(color))
+    return groups, main
+
+
+def merge_colors(colors, counts, tolerance=0, max_colors=0):
+    """
+    merge_colors(colors, counts, tolerance=0, max_colors=0)
+
+    take:
+        colors: RGBA colors in scan order
+        counts: number of pixels for every color
+        tolerance: colors with distance <= tolerance are one color
+        max_colors: maximum number of colors (median cut), 0 - all
+    return:
+        groups: number of new color for every color.
+
+    Work with colors, not with pixels: main colors take near colors
+    (see _leaders), then median cut for main colors.
+    """
+    groups = list(range(len(colors)))
+    if not colors:
+        # only background, nothing to merge
+        return groups
+    if tolerance > 0:
+        groups, main = _leaders(colors, counts, tolerance)
+        if max_colors:
+            # median cut for main colors
+            totals = [0] * len(main)
+            for i, group in enumerate(groups):
+                totals[group] += counts[i]
+            cut = _median_cut(main, totals, max_colors)
+            groups = [cut[group] for group in groups]
+    elif max_colors:
+        groups = _median_cut(colors, counts, max_colors)
+    return groups
+
+
+def find_background(image, share=BORDER):
+    """
+    find_background(image, share=BORDER)
+
+    take:
+        image: PIL image in any mode
+        share: part of border pixels with background color
+    return:
+        back: RGBA color of most border pixels or None.
+
+    Only edge rows and columns are converted to RGBA and counted with
+    getcolors, image is rejected before labelling. Equal counts - color
+    of pixel (0, 0).
+    """
+    w, h = image.size
+    counts = dict()
+    for box in ((0, 0, w, 1), (0, h - 1, w, h), (0, 0, 1, h),
+                (w - 1, 0, w, h)):
+        for count, color in image.crop(box).convert('RGBA').getcolors(w + h):
+            counts[color] = counts.get(color, 0) + count
+    corner = image.crop((0, 0, 1, 1)).convert('RGBA').getpixel((0, 0))
+    back = max(counts, key=lambda i: (counts[i], i == corner))
+    if counts[back] < share * sum(counts.values()):
+        return None
+    return back
+
+
+def _python_labels(image, back, tolerance=0, max_colors=0):
+    """
+    _python_labels(image, back, tolerance=0, max_colors=0)
+
+    take:
+        image: PIL RGBA image
+        back: RGBA background color
+        tolerance, max_colors: see merge_colors
     return:
         map_image: matrix with 0 - background, 1,2,3...n - diferent colors.
+
+    Fallback without numpy. One pass over the pixels to count colors and
+    one pass to put numbers of colors.
+    """
+    w, h = image.size
+    pixels = list(image.getdata())
+
+    colors = dict()
+    for pix in pixels:
+        if pix != back:
+            colors[pix] = colors.get(pix, 0) + 1
+
+    items = list(colors.items())
+    groups = merge_colors([i[0] for i in items], [i[1] for i in items],
+                          tolerance, max_colors)
+    totals = dict()
+    for item, group in zip(items, groups):
+        totals[group] = totals.get(group, 0) + item[1]
+
+    # sort colors for find main color, equal colors stay in scan order
+    sort_colors = sorted(list(totals.items()),
+                         key=lambda i: i[1], reverse=True)
+    ranks = {item[0]: num for num, item in enumerate(sort_colors, 1)}
+    numbers = {item[0]: ranks[group] for item, group in zip(items, groups)}
+
+    labels = [numbers.get(pix, 0) for pix in pixels]
+    return [labels[y * w:(y + 1) * w] for y in range(h)]
+
+
+def _color_numbers(colors, first, counts, tolerance=0, max_colors=0):
     """
+    _color_numbers(colors, first, counts, tolerance=0, max_colors=0)
 
-    image = Image.open(img)
-    image = image.convert('RGBA')
-    back = image.getpixel((0, 0))
+    take:
+        colors: numpy array with packed colors
+        first: position of first pixel of every color
+        counts: number of pixels for every color
+        tolerance, max_colors: see merge_colors
+    return:
+        numbers: numpy array with number for every color, 1 - main color.
+    """
+    if tolerance or max_colors:
+        # merge in scan order like python labels
+        scan = numpy.argsort(first, kind='stable')
+        rgba = colors[scan].astype('<u4').view(numpy.uint8).reshape(-1, 4)
+        groups = numpy.empty(len(colors), dtype=numpy.intp)
+        groups[scan] = merge_colors([tuple(i) for i in rgba.tolist()],
+                                    counts[scan].tolist(),
+                                    tolerance, max_colors)
+        size = int(groups.max()) + 1 if len(groups) else 0
+        counts = numpy.bincount(groups, weights=counts,
+                                minlength=size).astype(numpy.int64)
+        group_first = numpy.full(size, numpy.iinfo(numpy.int64).max)
+        numpy.minimum.at(group_first, groups, first)
+        first = group_first
+    else:
+        groups = numpy.arange(len(colors))
 
-    if back in [(0, 0, 0, 0), (255, 255, 255, 0), (0, 0, 0, 255),
-                (255, 255, 255, 255)]:
+    # main color first, equal colors in scan order like sorted()
+    order = numpy.lexsort((first, -counts))
 
-        w, h = image.size
+    dtype = numpy.min_scalar_type(len(order))
+    numbers = numpy.empty(len(order), dtype=dtype)
+    numbers[order] = numpy.arange(1, len(order) + 1, dtype=dtype)
+    return numbers[groups]
 
-        # create map image
-        map_image = [[0] * w for i in range(h)]
 
-        colors = dict()
-        # create map with colors
-        for y in range(h):
-            for x in range(w):
-                pix = image.getpixel((x, y))
+def _numpy_labels(image, back, tolerance=0, max_colors=0):
+    """
+    _numpy_labels(image, back, tolerance=0, max_colors=0)
 
-                if pix != back:
-                    if not colors.get(pix):
-                        colors[pix] = 1
-                    else:
-                        colors[pix] += 1
+    take:
+        image: PIL RGBA image
+        back: RGBA background color
+        tolerance, max_colors: see merge_colors
+    return:
+        map_image: numpy array (h, w) with 0 - background, 1,2,3...n.
+
+    Every RGBA pixel is packed to one uint32, colors are counted with
+    numpy.unique and numbers are gathered for all pixels at once.
+    """
+    w, h = image.size
+    pixels = numpy.frombuffer(image.tobytes(), dtype='<u4')
+    mask = pixels != int.from_bytes(bytes(back), 'little')
+
+    colors, first, inverse, counts = numpy.unique(
+        pixels[mask], return_index=True, return_inverse=True,
+        return_counts=True)
+    numbers = _color_numbers(colors, first, counts, tolerance, max_colors)
 
-                    map_image[y][x] = pix
+    labels = numpy.zeros(w * h, dtype=numbers.dtype)
+    labels[mask] = numbers[inverse.ravel()]
+    return labels.reshape(h, w)
 
-        # sort colors for find main color
-        sort_colors = sorted(list(colors.items()),
-                             key=lambda i: i[1], reverse=True)
 
-        # put  numbers to code colors
-        for y in range(h):
-            for num, item in enumerate(sort_colors, 1):
-                for x in range(w):
-                    if map_image[y][x] == item[0]:
-                        map_image[y][x] = num
+def open_source(img):
+    """
+    open_source(img)
 
+    take:
+        img: PATH to image file, file object, bytes or PIL image
+    return:
+        image: PIL image (not decoded if it is file).
+    """
+    if isinstance(img, Image.Image):
+        return img
+    if isinstance(img, (bytes, bytearray, memoryview)):
+        return Image.open(io.BytesIO(img))
+    return Image.open(img)
+
+
+def _source_name(img):
+    # path for timings, type for images in memory
+    return img if isinstance(img, str) else type(img).__name__
+
+
+def tiled_labels(img, path, rows=TILE, tolerance=0, max_colors=0):
+    """
+    tiled_labels(img, path, rows=TILE, tolerance=0, max_colors=0)
+
+    take:
+        img: PATH to image file, file object, bytes or PIL image
+        path: file for binary matrix (header + numbers)
+        rows: rows of image in one band
+        tolerance, max_colors: see merge_colors
+    return:
+        path or None if border has no background color.
+
+    For very big images (needs numpy). First pass over bands counts colors,
+    second pass puts numbers of band to numpy.memmap on the file.
+    Only one band is RGBA in memory, numbers are not in memory at all.
+    Source itself is decoded whole (find_background, crop of bands).
+    """
+    image = open_source(img)
+    w, h = image.size
+    back = find_background(image)
+    if back is None:
+        return None
+    back = int.from_bytes(bytes(back), 'little')
+
+    def bands():
+        for y in range(0, h, rows):
+            band = image.crop((0, y, w, min(h, y + rows))).convert('RGBA')
+            pixels = numpy.frombuffer(band.tobytes(), dtype='<u4')
+            yield y, pixels, pixels != back
+
+    colors = numpy.empty(0, dtype='<u4')
+    first = numpy.empty(0, dtype=numpy.int64)
+    counts = numpy.empty(0, dtype=numpy.int64)
+    for y, pixels, mask in bands():
+        band_colors, band_first, band_counts = numpy.unique(
+            pixels[mask], return_index=True, return_counts=True)
+        band_first = numpy.flatnonzero(mask)[band_first] + y * w
+        # add colors of band to colors of image
+        colors, where = numpy.unique(numpy.concatenate((colors, band_colors)),
+                                     return_inverse=True)
+        where = where.ravel()
+        counts = numpy.bincount(
+            where, weights=numpy.concatenate((counts, band_counts)),
+            minlength=len(colors)).astype(numpy.int64)
+        new_first = numpy.full(len(colors), w * h, dtype=numpy.int64)
+        numpy.minimum.at(new_first, where,
+                         numpy.concatenate((first, band_first)))
+        first = new_first
+
+    numbers = _color_numbers(colors, first, counts, tolerance, max_colors)
+    top = int(numbers.max()) if len(numbers) else 0
+    typecode = 'B' if top < 256 else 'H' if top < 65536 else 'I'
+    itemsize = array(typecode).itemsize
+    size = w * h * itemsize
+    with open(path, 'wb') as file:
+        file.write(HEADER.pack(MAGIC, 1, typecode.encode(), 0, w, h, size))
+        file.truncate(HEADER.size + size)
+
+    labels = numpy.memmap(path, dtype=f'<u{itemsize}', mode='r+',
+                          offset=HEADER.size, shape=(h, w))
+    for y, pixels, mask in bands():
+        band = numpy.zeros(len(pixels), dtype=labels.dtype)
+        band[mask] = numbers[numpy.searchsorted(colors, pixels[mask])]
+        labels[y:y + len(pixels) // w] = band.reshape(-1, w)
+    labels.flush()
+    del labels
+    return path
+
+
+def _row_runs(map_image):
+    # runs of numbers in every row: starts, lengths, numbers, rows
+    if numpy is not None and isinstance(map_image, numpy.ndarray):
+        h, w = map_image.shape
+        flat = map_image.ravel()
+        change = numpy.ones(flat.size, dtype=bool)
+        change[1:] = flat[1:] != flat[:-1]
+        # every row starts new run
+        change[::w] = True
+        starts = numpy.flatnonzero(change)
+        lengths = numpy.diff(numpy.append(starts, flat.size))
+        return starts % w, lengths, flat[starts], starts // w
+
+    starts, lengths, numbers, rows = [], [], [], []
+    for y, row in enumerate(map_image):
+        x = 0
+        for num, run in groupby(row):
+            size = sum(1 for i in run)
+            starts.append(x)
+            lengths.append(size)
+            numbers.append(num)
+            rows.append(y)
+            x += size
+    return starts, lengths, numbers, rows
+
+
+def components(map_image, connectivity=4):
+    """
+    components(map_image, connectivity=4)
+
+    take:
+        map_image: numpy array or matrix from image_labels
+        connectivity: 4 - neighbours by side, 8 - also by corner
+    return:
+        map_image: same type, 0 - background, 1,2,3...n - connected parts
+                   of one number in scan order.
+
+    Two passes over runs of rows: union-find joins touching runs of the
+    same number in neighbour rows, then runs get numbers of parts.
+    Linear in number of runs, pixels are touched only by numpy.
+    """
+    starts, lengths, numbers, rows = _row_runs(map_image)
+    is_array = not isinstance(starts, list)
+    if is_array:
+        starts, lengths = starts.tolist(), lengths.tolist()
+        numbers, rows = numbers.tolist(), rows.tolist()
+
+    near = 1 if connectivity == 8 else 0
+    parent = list(range(len(starts)))
+
+    def find(i):
+        while parent[i] != i:
+            parent[i] = parent[parent[i]]
+            i = parent[i]
+        return i
+
+    prev, cur = [], []
+    last_row = -1
+    for index, start, size, num, y in zip(range(len(starts)), starts,
+                                          lengths, numbers, rows):
+        if y != last_row:
+            prev = cur if y == last_row + 1 else []
+            cur = []
+            last_row = y
+            j = 0
+        if not num:
+            continue
+        end = start + size
+        # skip runs of previous row before this run
+        while j < len(prev) and prev[j][1] + near <= start:
+            j += 1
+        k = j
+        while k < len(prev) and prev[k][0] < end + near:
+            if prev[k][2] == num:
+                a, b = find(index), find(prev[k][3])
+                # first run in scan order is root
+                if a < b:
+                    parent[b] = a
+                elif b < a:
+                    parent[a] = b
+            k += 1
+        cur.append((start, end, num, index))
+
+    parts = [0] * len(starts)
+    ids = dict()
+    for index, num in enumerate(numbers):
+        if num:
+            root = find(index)
+            if root not in ids:
+                ids[root] = len(ids) + 1
+            parts[index] = ids[root]
+
+    if is_array:
+        h, w = map_image.shape
+        dtype = numpy.min_scalar_type(len(ids))
+        parts = numpy.array(parts, dtype=dtype)
+        return numpy.repeat(parts, lengths).reshape(h, w)
+    w = len(map_image[0])
+    flat = list(chain.from_iterable(map(lambda i, j: [i] * j, parts,
+                                        lengths)))
+    return [flat[y * w:(y + 1) * w] for y in range(len(map_image))]
+
+
+def image_labels(img, tolerance=0, max_colors=0, connectivity=0):
+    """
+    image_labels(img, tolerance=0, max_colors=0, connectivity=0)
+
+    take:
+        img: PATH to image file, file object, bytes or PIL image
+        tolerance: colors with distance <= tolerance are one color
+        max_colors: maximum number of colors, 0 - all
+        connectivity: 4 or 8 - numbers of connected parts, 0 - of colors
+    return:
+        map_image: numpy array or matrix with 0 - background, 1,2,3...n.
+    """
+    with timing('decode', file=_source_name(img)) as count:
+        image = open_source(img)
+        back = find_background(image)
+        if back is not None:
+            image = image.convert('RGBA')
+        count['pixels'] = image.width * image.height
+
+    if back is not None:
+        with timing('label', pixels=count['pixels']) as count:
+            if numpy is not None:
+                map_image = _numpy_labels(image, back, tolerance,
+                                          max_colors)
+                count['colors'] = int(map_image.max(initial=0))
+            else:
+                map_image = _python_labels(image, back, tolerance,
+                                           max_colors)
+                count['colors'] = max(map(max, map_image), default=0)
+        if connectivity:
+            with timing('components', pixels=count['pixels']) as count:
+                map_image = components(map_image, connectivity)
         return map_image
 
 
+def image_matrix(img, tolerance=0, max_colors=0, connectivity=0):
+    """
+    image_matrix(img, tolerance=0, max_colors=0, connectivity=0)
+
+    take:
+        img: PATH to image file, file object, bytes or PIL image
+        tolerance: colors with distance <= tolerance are one color
+        max_colors: maximum number of colors, 0 - all
+        connectivity: 4 or 8 - numbers of connected parts, 0 - of colors
+    return:
+        map_image: matrix with 0 - background, 1,2,3...n - diferent colors.
+    """
+    map_image = image_labels(img, tolerance, max_colors, connectivity)
+    if numpy is not None and isinstance(map_image, numpy.ndarray):
+        return map_image.tolist()
+    return map_image
+
+
+def run_lengths(map_image):
+    """
+    run_lengths(map_image)
+
+    take:
+        map_image: numpy array or matrix from image_labels
+    return:
+        (numbers, lengths): runs of same numbers row after row.
+    """
+    if numpy is not None and isinstance(map_image, numpy.ndarray):
+        flat = map_image.ravel()
+        starts = numpy.flatnonzero(flat[1:] != flat[:-1]) + 1
+        starts = numpy.concatenate(([0], starts))
+        lengths = numpy.diff(numpy.append(starts, flat.size))
+        return flat[starts], lengths
+
+    numbers, lengths = [], []
+    for num, run in groupby(chain.from_iterable(map_image)):
+        numbers.append(num)
+        lengths.append(sum(1 for i in run))
+    return numbers, lengths
+
+
+def _to_bytes(numbers, typecode):
+    # little-endian bytes for list or numpy array
+    if numpy is not None and isinstance(numbers, numpy.ndarray):
+        itemsize = array(typecode).itemsize
+        return numbers.astype(f'<u{itemsize}').tobytes()
+    numbers = array(typecode, numbers)
+    if byteorder == 'big':
+        numbers.byteswap()
+    return numbers.tobytes()
+
+
+def pack_matrix(map_image, compress=False, rle=False):
+    """
+    pack_matrix(map_image, compress=False, rle=False)
+
+    take:
+        map_image: numpy array or matrix from image_labels
+        compress: compress numbers with zlib
+        rle: runs of numbers instead of every number, small for images
+             with big background
+    return:
+        frame: bytes with header and numbers for mapimg.py.
+    """
+    if numpy is not None and isinstance(map_image, numpy.ndarray):
+        h, w = map_image.shape
+        top = int(map_image.max()) if map_image.size else 0
+    else:
+        h, w = len(map_image), len(map_image[0])
+        top = max(max(row) for row in map_image)
+
+    typecode = 'B' if top < 256 else 'H' if top < 65536 else 'I'
+    flags = 0
+    version = 1
+    if rle:
+        numbers, lengths = run_lengths(map_image)
+        data = _to_bytes(numbers, typecode) + _to_bytes(lengths, 'I')
+        flags |= RLE
+        version = 2
+    elif numpy is not None and isinstance(map_image, numpy.ndarray):
+        data = _to_bytes(map_image, typecode)
+    else:
+        data = _to_bytes(chain.from_iterable(map_image), typecode)
+
+    if compress:
+        data = zlib.compress(data)
+        flags |= ZLIB
+    header = HEADER.pack(MAGIC, version, typecode.encode(), flags,
+                         w, h, len(data))
+    return header + data
+
+
+def matrix_bytes(map_image, text=False, compress=False, rle=False):
+    """
+    matrix_bytes(map_image, text=False, compress=False, rle=False)
+
+    take:
+        map_image: numpy array or matrix from image_labels
+        text: matrix as python list (old format) with new line
+        compress: compress binary matrix with zlib
+        rle: binary matrix with runs of numbers
+    return:
+        data: bytes for stdout.
+    """
+    if text:
+        if numpy is not None and isinstance(map_image, numpy.ndarray):
+            map_image = map_image.tolist()
+        # use print format easiest way but it is also a string
+        return f'{map_image}\n'.encode()
+    return pack_matrix(map_image, compress, rle)
+
+
+def write_matrix(map_image, text=False, compress=False, rle=False):
+    """
+    write_matrix(map_image, text=False, compress=False, rle=False)
+
+    take:
+        map_image: numpy array or matrix from image_labels
+        text: print matrix as python list (old format)
+        compress: compress binary matrix with zlib
+        rle: binary matrix with runs of numbers
+    return:
+        None
+    """
+    stdout.buffer.write(matrix_bytes(map_image, text, compress, rle))
+    # next process starts while we label the next image
+    stdout.buffer.flush()
+
+
+def cache_key(img, *parts):
+    """
+    cache_key(img, *parts)
+
+    take:
+        img: PATH to image file
+        parts: everything else changing matrix (options, format)
+    return:
+        key: sha1 hex of file content, version of imgmap and parts.
+    """
+    digest = hashlib.sha1()
+    with open(img, 'rb') as file:
+        for block in iter(partial(file.read, 2 ** 20), b''):
+            digest.update(block)
+    meta = json.dumps([__version__, VERSION, parts], sort_keys=True)
+    digest.update(meta.encode())
+    return digest.hexdigest()
+
+
+def cache_get(folder, key):
+    """
+    cache_get(folder, key)
+
+    take:
+        folder: cache dir
+        key: from cache_key
+    return:
+        data: bytes from cache_put or None.
+    """
+    name = join(folder, f'{key}.imap.z')
+    try:
+        with open(name, 'rb') as file:
+            data = zlib.decompress(file.read())
+    except (OSError, zlib.error):
+        return None
+    # last use for LRU
+    utime(name)
+    return data
+
+
+def cache_put(folder, key, data):
+    """
+    cache_put(folder, key, data)
+
+    take:
+        folder: cache dir
+        key: from cache_key
+        data: bytes for stdout
+    return:
+        None
+    """
+    makedirs(folder, exist_ok=True)
+    handle, temp = mkstemp(dir=folder, suffix='.tmp')
+    with open(handle, 'wb') as file:
+        file.write(zlib.compress(data))
+    # other processes see whole file or nothing
+    replace(temp, join(folder, f'{key}.imap.z'))
+
+
+def evict_cache(folder, limit):
+    """
+    evict_cache(folder, limit)
+
+    take:
+        folder: cache dir
+        limit: maximum size of dir in bytes
+    return:
+        removed: number of removed files, least recently used first.
+    """
+    try:
+        files = [i for i in scandir(folder) if i.name.endswith('.imap.z')]
+    except OSError:
+        return 0
+    files = sorted(((i.stat().st_mtime, i.stat().st_size, i.path)
+                    for i in files), reverse=True)
+    total = 0
+    removed = 0
+    for mtime, size, name in files:
+        total += size
+        if total > limit:
+            remove(name)
+            removed += 1
+    return removed
+
+
+def label_file(img, text=False, compress=False, options=None, rle=False,
+               tile=0, folder=None, cache=None):
+    """
+    label_file(img, text=False, compress=False, options=None, rle=False,
+               tile=0, folder=None, cache=None)
+
+    take:
+        img: PATH to image file
+        text: matrix as python list (old format)
+        compress: compress binary matrix with zlib
+        options: dict with keyword arguments for image_labels
+        rle: binary matrix with runs of numbers
+        tile: rows in band for tiled_labels, 0 - whole image in memory
+        folder: dir for files of tiled_labels, None - temporary files
+        cache: dir with matrices of unchanged files, None - no cache
+    return:
+        (img, data, error): data from matrix_bytes (or path to file from
+                            tiled_labels) or error message.
+
+    Errors are returned, one broken file does not stop others.
+    """
+    try:
+        if tile:
+            # unique name, same basename in other dirs
+            handle, path = mkstemp(dir=folder, suffix='.imap',
+                                   prefix=f'{basename(img)}.')
+            close(handle)
+            data = None
+            try:
+                with timing('label', file=str(img)) as count:
+                    data = tiled_labels(img, path, tile, **(options or {}))
+                    count['bytes'] = getsize(data) if data else 0
+            finally:
+                # no frame, no file (also after error)
+                if data is None:
+                    remove(path)
+        else:
+            data = None
+            if cache:
+                with timing('cache', file=str(img)) as count:
+                    key = cache_key(img, options, text, compress, rle)
+                    data = cache_get(cache, key)
+                    count['hit'] = data is not None
+            if data is None:
+                map_image = image_labels(img, **(options or {}))
+                if map_image is not None:
+                    with timing('serialize') as count:
+                        data = matrix_bytes(map_image, text, compress, rle)
+                        count['bytes'] = len(data)
+                    if cache:
+                        cache_put(cache, key, data)
+    except Exception as err:
+        return img, None, str(err)
+    if data is None:
+        return img, None, 'no background color on border'
+    return img, data, None
+
+
 if __name__ == '__main__':
+    parser = ArgumentParser(description='Create matrix from image.')
+    parser.add_argument('images', nargs='*', help='paths to images')
+    parser.add_argument('--text', action='store_true',
+                        help='print matrix as python list')
+    parser.add_argument('--zip', action='store_true',
+                        help='compress binary matrix with zlib')
+    parser.add_argument('--rle', action='store_true',
+                        help='binary matrix with runs of numbers')
+    parser.add_argument('-t', '--tolerance', type=float, default=0,
+                        help='colors with distance <= tolerance are one')
+    parser.add_argument('-c', '--colors', type=int, default=0,
+                        help='maximum number of colors (median cut)')
+    parser.add_argument('--components', type=int, default=0,
+                        choices=(4, 8), metavar='4|8',
+                        help='numbers of connected parts, not of colors')
+    parser.add_argument('--tile', type=int, default=0, metavar='ROWS',
+                        help='RGBA bands of rows and memory-mapped matrix for '
+                        'very big images, source is decoded whole (numpy)')
+    parser.add_argument('--memmap', metavar='DIR',
+                        help='keep files with matrices of --tile in DIR')
+    parser.add_argument('--cache', metavar='DIR',
+                        help='keep matrices of unchanged images in DIR')
+    parser.add_argument('--cache-size', type=int, default=CACHE_SIZE,
+                        metavar='MB', help='size of --cache DIR')
+    parser.add_argument('-j', '--jobs', type=int, default=1,
+                        help='processes for images')
+    parser.add_argument('--timings', metavar='FILE',
+                        help='json lines with time of stages, - for stderr')
+    parser.add_argument('--unordered', action='store_true',
+                        help='write matrices in order of completion')
+    args = parser.parse_args()
+    if args.tile and numpy is None:
+        parser.error('--tile needs numpy')
+    if args.tile and (args.text or args.zip or args.rle):
+        parser.error('--tile writes plain binary matrices')
+    if args.tile and args.components:
+        parser.error('--tile does not use --components')
+    if args.tile and args.cache:
+        parser.error('--tile does not use --cache')
+
     inp = []
     EXT = ('*.jpeg', '*.jpg', '*.png', '*.gif', '*.tiff', '*.tif', '*.bmp')
-    if argv[1:]:
-        inp = [i for i in argv[1:] if path.exists(i)]
+    if args.images:
+        inp = [i for i in args.images if path.exists(i)]
     elif stdin.isatty() is False:
-        # to avoid /n in the end of the line
-        inp = [i.strip() for i in stdin.readlines()
-               if path.exists(i.strip())]
+        # read paths one by one, to avoid /n in the end of the line
+        inp = (i.strip() for i in stdin if path.exists(i.strip()))
 
     elif any([glob(i) for i in EXT]):
         all_images = [glob(i) for i in EXT] + [glob(i.upper()) for i in EXT]
-        inp = [image for list_ in all_images
-               for image in list_]
+        inp = (image for list_ in all_images
+               for image in list_)
     else:
         stderr.write('Error: empty input\n')
-    if inp:
-        map_collection = []
-        for i in inp:
-            matrix = image_matrix(i)
-            if matrix:
-                map_collection.append(matrix)
-            else:
-                stderr.write(
-                    'Error: use black/white/transparent background\n'
-                )
 
-        for i in map_collection:
-            # use print easiest way but it is also a string
-            print(i)
+    options = dict(tolerance=args.tolerance, max_colors=args.colors)
+    if args.components:
+        options['connectivity'] = args.components
+    work = partial(label_file, text=args.text, compress=args.zip,
+                   options=options, rle=args.rle, tile=args.tile,
+                   folder=args.memmap, cache=args.cache)
+    set_timings(args.timings)
+    if args.jobs > 1:
+        pool = Pool(args.jobs, set_timings, (args.timings,))
+        if args.unordered:
+            results = pool.imap_unordered(work, inp)
+        else:
+            results = pool.imap(work, inp)
     else:
+        # one image in memory: label, write and forget
+        results = map(work, inp)
+
+    count = 0
+    with timing('run', files=0, errors=0, bytes=0) as total:
+        for img, data, error in results:
+            count += 1
+            if error:
+                stderr.write(f'Error: {img}: {error}\n')
+                total['errors'] += 1
+            elif args.tile:
+                with open(data, 'rb') as file:
+                    copyfileobj(file, stdout.buffer)
+                total['bytes'] += getsize(data)
+                if not args.memmap:
+                    remove(data)
+                stdout.buffer.flush()
+            else:
+                stdout.buffer.write(data)
+                stdout.buffer.flush()
+                total['bytes'] += len(data)
+        total['files'] = count - total['errors']
+        if args.jobs > 1:
+            pool.close()
+        if args.cache:
+            evict_cache(args.cache, args.cache_size * 2 ** 20)
+    if not count:
         stderr.write('Error: wrong path\n')
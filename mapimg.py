@@ -18,6 +18,18 @@ Stdin without imgmap.py + scale.
 echo '[[1,1,0,1,1],[0,0,1,0,0],[1,1,0,1,1]]' | mapimg.py -4
 Stdin without imgmap.py + scale and 2 colors
 echo '[[1,1,2,1,1],[0,2,1,2,0],[1,1,2,1,1]]' | mapimg.py -4 222,0,222,255 128,128,128,255
+
+Every matrix in many colors, one palette in line of file.
+$ imgmap.py test.png | mapimg.py -4 --palettes teams.txt
+
+Time of stages as json lines (stderr or file).
+$ imgmap.py test.png | mapimg.py --timings - -1 222,0,222,220
+
+Stdin reads binary matrices from imgmap.py and text matrices (one per line).
+
+Library: read_matrices takes bytes, matrix_image returns PIL image and
+png_bytes returns png without files.
+>>> png_bytes(next(read_matrices(frame)), 4, [(222, 0, 222, 220)])
 """
 
 __version__ = 1.0
@@ -46,13 +58,231 @@ __version__ = 1.0
 # DEALINGS IN THE SOFTWARE.
 
 
-from os import getcwd, sep
-from sys import argv, stderr, stdin
+import io
+import json
+import zlib
+from array import array
+from collections import namedtuple
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+from itertools import chain
+from os import getcwd, getpid, sep
+from os.path import getsize
+from re import fullmatch
+from struct import Struct, pack
+from sys import argv, byteorder, stderr, stdin
+from threading import Lock
+from time import perf_counter
 from PIL import Image
 
 DEFAULT_COLOR = (0, 255, 0, 255)
 SCALE = 1
 
+# binary matrix from imgmap.py
+# magic, version, typecode, flags, width, height, size of data
+# RLE data: numbers of runs, then uint32 lengths of runs (version 2)
+MAGIC = b'IMAP'
+VERSION = 2
+HEADER = Struct('<4sBcBxIII')
+ZLIB = 1
+RLE = 2
+
+PNG = b'\x89PNG\r\n\x1a\n'
+IEND = pack('>I', 0) + b'IEND' + pack('>I', zlib.crc32(b'IEND'))
+
+# one byte for every number of palette image
+INDEXES = [bytes((i,)) for i in range(256)]
+
+# labels: flat sequence of numbers, row after row
+# counts: None or lengths of runs, then labels are numbers of runs
+Matrix = namedtuple('Matrix', 'width height labels counts',
+                    defaults=(None,))
+
+TOOL = 'mapimg'
+STDERR = stderr
+# json lines with timings of stages (--timings), None - off
+_timings = None
+_timings_lock = Lock()
+
+
+def set_timings(path):
+    """
+    set_timings(path)
+
+    take:
+        path: file for json lines with timings, '-' - stderr, None - off
+    return:
+        None
+    """
+    global _timings
+    with _timings_lock:
+        # old file is closed, stderr stays open
+        if _timings is not None and _timings is not STDERR:
+            _timings.close()
+        if path is None:
+            _timings = None
+        elif path == '-':
+            _timings = STDERR
+        else:
+            _timings = open(path, 'a', buffering=1)
+
+
+@contextmanager
+def timing(stage, **counters):
+    """
+    timing(stage, **counters)
+
+    take:
+        stage: name of stage
+        counters: pixels, colors, bytes, files... (change in with block)
+    return:
+        context manager with dict of counters.
+
+    Write json line with seconds and counters if timings are on.
+    """
+    if _timings is None:
+        yield counters
+        return
+    start = perf_counter()
+    yield counters
+    record = dict(tool=TOOL, stage=stage, pid=getpid(),
+                  seconds=round(perf_counter() - start, 6), **counters)
+    with _timings_lock:
+        _timings.write(json.dumps(record) + '\n')
+
+
+def text_matrix(line):
+    """
+    text_matrix(line)
+
+    take:
+        line: matrix as python list '[[0, 1], [1, 0]]'
+    return:
+        Matrix
+    """
+    return as_matrix(json.loads(line))
+
+
+def unpack_matrix(stream):
+    """
+    unpack_matrix(stream)
+
+    take:
+        stream: binary stream at the begining of frame from imgmap.py
+    return:
+        Matrix with labels as memoryview on the frame data.
+    """
+    header = stream.read(HEADER.size)
+    if len(header) < HEADER.size:
+        raise ValueError('broken matrix header')
+    magic, version, typecode, flags, w, h, size = HEADER.unpack(header)
+    if magic != MAGIC or version > VERSION:
+        raise ValueError('unknown matrix format')
+
+    data = stream.read(size)
+    if len(data) < size:
+        raise ValueError('broken matrix data')
+    if flags & ZLIB:
+        data = zlib.decompress(data)
+
+    typecode = typecode.decode()
+    counts = None
+    if flags & RLE:
+        runs = len(data) // (array(typecode).itemsize + 4)
+        split = runs * array(typecode).itemsize
+        data, counts = memoryview(data)[:split], memoryview(data)[split:]
+        counts = _numbers(counts, 'I')
+    return Matrix(w, h, _numbers(data, typecode), counts)
+
+
+def _numbers(data, typecode):
+    # little-endian data without copy
+    if byteorder == 'big':
+        numbers = array(typecode, data)
+        numbers.byteswap()
+        return numbers
+    return memoryview(data).cast(typecode)
+
+
+def read_matrices(stream):
+    """
+    read_matrices(stream)
+
+    take:
+        stream: binary stream with frames from imgmap.py or text lines,
+                or bytes of stream
+    return:
+        generator of Matrix
+    """
+    if isinstance(stream, (bytes, bytearray, memoryview)):
+        stream = io.BufferedReader(io.BytesIO(stream))
+    while True:
+        head = stream.peek(1)[:1]
+        if not head:
+            return
+        with timing('parse') as count:
+            if head == MAGIC[:1]:
+                matrix = unpack_matrix(stream)
+            else:
+                line = stream.readline()
+                matrix = text_matrix(line) if line.strip() else None
+            if matrix is not None:
+                count['pixels'] = matrix.width * matrix.height
+        if matrix is not None:
+            yield matrix
+
+
+def as_matrix(map_image):
+    """
+    as_matrix(map_image)
+
+    take:
+        map_image: Matrix or matrix (list of rows)
+    return:
+        Matrix
+    """
+    if isinstance(map_image, Matrix):
+        return map_image
+    labels = array('I', chain.from_iterable(map_image))
+    return Matrix(len(map_image[0]), len(map_image), labels)
+
+
+def color_table(colors, top):
+    """
+    color_table(colors, top)
+
+    take:
+        colors: list with RGB/RGBA colors  colors[0] == main color;
+        top: biggest number in matrix.
+    return:
+        table: RGBA bytes for every number 0..top
+        delta_color: number of colors to finish image.
+    """
+    # RGB colors without alpha are opaque
+    rgba = [bytes(tuple(i) + (255,) * (4 - len(i))) for i in colors]
+    # if not enougnh colors use again first color
+    table = [bytes(4)] + rgba[:top] + [rgba[0]] * (top - len(rgba))
+    # give solutions how many colors need to finish image
+    delta_color = max(0, top - len(colors))
+    return table, delta_color
+
+
+def expand(map_image, table):
+    """
+    expand(map_image, table)
+
+    take:
+        map_image: Matrix
+        table: bytes for every number
+    return:
+        data: bytes of all pixels, one join for every number or run.
+    """
+    if map_image.counts is not None:
+        return b''.join(map(bytes.__mul__,
+                            map(table.__getitem__, map_image.labels),
+                            map_image.counts))
+    return b''.join(map(table.__getitem__, map_image.labels))
+
 
 def matrix_image(map_image, scale, colors):
     """
@@ -60,56 +290,318 @@ def matrix_image(map_image, scale, colors):
 
     take:
         map_image: matrix with 0 - background, 1,2,3...n - diferent colors;
+                   list of rows or Matrix
         colors: list with RGB colors  colors[0] == main color.
     return:
         new_clone: PIL Image
         delta_color: number of colors to finish image.
-    """
-    new_w = len(map_image[0])
-    new_h = len(map_image)
 
-    new_clone = Image.new('RGBA', (new_w, new_h), (0, 0, 0, 0))
+    Whole image is built from color table at once. Up to 255 colors
+    numbers are the indexes of palette image.
+    """
+    map_image = as_matrix(map_image)
+    new_w = map_image.width
+    new_h = map_image.height
+    labels = map_image.labels
 
-    delta_color = 0
-    for i in range(new_h):
-        for j in range(new_w):
-            if map_image[i][j] != 0:
-                # if not enougnh colors use again first color
-                if map_image[i][j] <= len(colors):
-                    color = colors[map_image[i][j] - 1]
-                else:
-                    # give solutions how many colors need to finish image
-                    delta = map_image[i][j] - len(colors)
-                    if delta > delta_color:
-                        delta_color = delta
+    top = max(labels, default=0)
+    table, delta_color = color_table(colors, top)
 
-                    color = colors[0]
-                new_clone.putpixel((j, i), color)
+    if top < 256:
+        if map_image.counts is not None:
+            data = expand(map_image, INDEXES)
+        elif getattr(labels, 'itemsize', 0) != 1:
+            data = array('B', labels).tobytes()
+        else:
+            data = bytes(labels)
+        new_clone = Image.frombytes('P', (new_w, new_h), data)
+        new_clone.putpalette(b''.join(table), 'RGBA')
+        new_clone = new_clone.convert('RGBA')
+    else:
+        data = expand(map_image, table)
+        new_clone = Image.frombytes('RGBA', (new_w, new_h), data)
 
-    new_clone = new_clone.resize((new_w * scale, new_h * scale))
+    # nearest neighbour: every number is scale x scale square
+    new_clone = new_clone.resize((new_w * scale, new_h * scale),
+                                 Image.NEAREST)
 
     return new_clone, delta_color
 
 
+def matrix_rows(map_image, table):
+    """
+    matrix_rows(map_image, table)
+
+    take:
+        map_image: Matrix
+        table: bytes for every number (pixel or scaled pixel)
+    return:
+        generator of bytes for every row.
+    """
+    w = map_image.width
+    labels = map_image.labels
+    if map_image.counts is None:
+        for i in range(map_image.height):
+            yield b''.join(map(table.__getitem__, labels[i * w:(i + 1) * w]))
+        return
+
+    # runs can continue on the next row
+    row = []
+    left = w
+    for label, count in zip(labels, map_image.counts):
+        while count:
+            num = min(count, left)
+            row.append(table[label] * num)
+            count -= num
+            left -= num
+            if not left:
+                yield b''.join(row)
+                row = []
+                left = w
+
+
+def _chunk(kind, data):
+    return (pack('>I', len(data)) + kind + data +
+            pack('>I', zlib.crc32(kind + data)))
+
+
+def _png_head(width, height, table, top):
+    # signature, IHDR and palette: only part of png with colors
+    if top < 256:
+        return (PNG + _chunk(b'IHDR', pack('>IIBBBBB', width, height,
+                                           8, 3, 0, 0, 0)) +
+                _chunk(b'PLTE', b''.join(i[:3] for i in table)) +
+                _chunk(b'tRNS', bytes(i[3] for i in table)))
+    return PNG + _chunk(b'IHDR', pack('>IIBBBBB', width, height,
+                                      8, 6, 0, 0, 0))
+
+
+def png_chunks(map_image, scale, pixels, size, level=6):
+    """
+    png_chunks(map_image, scale, pixels, size, level=6)
+
+    take:
+        map_image: Matrix
+        scale: integer scale
+        pixels: scaled bytes for every number (index or RGBA)
+        size: bytes in one row of png
+        level: zlib compression level
+    return:
+        generator of IDAT chunks about 64 KB.
+    """
+    compressor = zlib.compressobj(level)
+    # same rows: filter "up" with zero difference
+    same = b'\x02' + bytes(size)
+    data = []
+    pending = 0
+    for row in matrix_rows(map_image, pixels):
+        block = compressor.compress(b'\x00' + row)
+        data.append(block)
+        pending += len(block)
+        for i in range(scale - 1):
+            block = compressor.compress(same)
+            data.append(block)
+            pending += len(block)
+        if pending > 2 ** 16:
+            yield _chunk(b'IDAT', b''.join(data))
+            data = []
+            pending = 0
+    data.append(compressor.flush())
+    yield _chunk(b'IDAT', b''.join(data))
+
+
+def save_png(map_image, scale, colors, filename, level=6):
+    """
+    save_png(map_image, scale, colors, filename, level=6)
+
+    take:
+        map_image: matrix with 0 - background, 1,2,3...n - diferent colors;
+                   list of rows or Matrix
+        scale: integer scale, every number is scale x scale square
+        colors: list with RGB colors  colors[0] == main color.
+        filename: path to png or binary file object
+        level: zlib compression level
+    return:
+        delta_color: number of colors to finish image.
+
+    Same pixels as matrix_image, but rows go to png encoder one by one,
+    image is never in memory. Up to 255 colors png has palette.
+    """
+    map_image = as_matrix(map_image)
+    top = max(map_image.labels, default=0)
+    table, delta_color = color_table(colors, top)
+    width = map_image.width * scale
+
+    if top < 256:
+        pixels = [i * scale for i in INDEXES[:top + 1]]
+        size = width
+    else:
+        pixels = [i * scale for i in table]
+        size = width * 4
+
+    with _binary_file(filename) as file:
+        file.write(_png_head(width, map_image.height * scale, table, top))
+        for chunk in png_chunks(map_image, scale, pixels, size, level):
+            file.write(chunk)
+        file.write(IEND)
+    return delta_color
+
+
+@contextmanager
+def _binary_file(filename):
+    # file object stays open for caller
+    if hasattr(filename, 'write'):
+        yield filename
+    else:
+        with open(filename, 'wb') as file:
+            yield file
+
+
+def png_bytes(map_image, scale, colors, level=6):
+    """
+    png_bytes(map_image, scale, colors, level=6)
+
+    take:
+        map_image: matrix with 0 - background, 1,2,3...n - diferent colors;
+                   list of rows or Matrix
+        scale: integer scale, every number is scale x scale square
+        colors: list with RGB colors  colors[0] == main color.
+        level: zlib compression level
+    return:
+        (data, delta_color): png bytes and number of colors to finish
+                             image, no files.
+    """
+    buffer = io.BytesIO()
+    delta_color = save_png(map_image, scale, colors, buffer, level)
+    return buffer.getvalue(), delta_color
+
+
+def save_palettes(map_image, scale, palettes, filenames, level=6,
+                  jobs=None):
+    """
+    save_palettes(map_image, scale, palettes, filenames, level=6, jobs=None)
+
+    take:
+        map_image: matrix with 0 - background, 1,2,3...n - diferent colors;
+                   list of rows or Matrix
+        scale: integer scale, every number is scale x scale square
+        palettes: list of colors lists, one image for every palette
+        filenames: paths to png (or binary file objects) for every palette
+        level: zlib compression level
+        jobs: number of threads to write images
+    return:
+        deltas: number of colors to finish every image.
+
+    Up to 255 colors pixels are compressed once, every png gets only
+    own palette. Else every palette is encoded in own thread.
+    """
+    map_image = as_matrix(map_image)
+    top = max(map_image.labels, default=0)
+    width = map_image.width * scale
+    height = map_image.height * scale
+
+    if top < 256:
+        pixels = [i * scale for i in INDEXES[:top + 1]]
+        chunks = b''.join(png_chunks(map_image, scale, pixels, width, level))
+
+        def save(colors, filename):
+            table, delta_color = color_table(colors, top)
+            with _binary_file(filename) as file:
+                file.write(_png_head(width, height, table, top))
+                file.write(chunks)
+                file.write(IEND)
+            return delta_color
+    else:
+        def save(colors, filename):
+            return save_png(map_image, scale, colors, filename, level)
+
+    with ThreadPoolExecutor(jobs) as executor:
+        return list(executor.map(save, palettes, filenames))
+
+
+def read_palettes(path):
+    """
+    read_palettes(path)
+
+    take:
+        path: text file, one palette in line: 222,0,222,220 100,220,0,200
+              empty lines and lines with # are skipped
+    return:
+        palettes: list of colors lists.
+    """
+    palettes = []
+    with open(path) as file:
+        for line in file:
+            line = line.split('#')[0].strip()
+            if line:
+                palettes.append([tuple(int(j) for j in i.split(','))
+                                 for i in line.split()])
+    return palettes
+
+
 if __name__ == '__main__':
     if stdin.isatty() is False:
-        # all errors in stderr
-        for num, matr in enumerate(stdin.readlines(), 1):
-            if len(argv) > 1 and argv[1].startswith('-'):
-                scale = int(argv[1][1:])
+        args = argv[1:]
+        palettes = None
+        if '--palettes' in args:
+            pos = args.index('--palettes')
+            palettes = args[pos + 1:pos + 2]
+            del args[pos:pos + 2]
+        # json lines with time of stages, - for stderr
+        # next arg is file if it is not scale or color
+        if '--timings' in args:
+            pos = args.index('--timings')
+            path = args[pos + 1:pos + 2]
+            if path and (path[0] == '-' or
+                         not fullmatch(r'-\d+|[\d\s,()\[\]]+', path[0])):
+                set_timings(path[0])
+                del args[pos:pos + 2]
             else:
-                scale = SCALE
-            if argv[2:]:
-                colors = [eval(i) for i in argv[2:]]
-            else:
-                colors = [DEFAULT_COLOR]
-            image, delta = matrix_image(eval(matr), scale, colors)
+                set_timings('-')
+                del args[pos]
+
+        if args and args[0].startswith('-'):
+            scale = int(args[0][1:])
+        else:
+            scale = SCALE
+        if args[1:]:
+            colors = [eval(i) for i in args[1:]]
+        else:
+            colors = [DEFAULT_COLOR]
+
+        # all errors in stderr
+        # matrices come one by one, save image before read the next
+        try:
+            if palettes is not None:
+                if not palettes:
+                    raise ValueError('no palettes file')
+                palettes = read_palettes(palettes[0])
+            for num, matr in enumerate(read_matrices(stdin.buffer), 1):
+                with timing('encode') as count:
+                    if palettes:
+                        # one parsed matrix, image for every palette
+                        filenames = [f'mapimg_{num}_{i}.png'
+                                     for i in range(1, len(palettes) + 1)]
+                        deltas = save_palettes(matr, scale, palettes,
+                                               filenames)
+                    else:
+                        filenames = [f'mapimg_{num}.png']
+                        # image is written row by row
+                        deltas = [save_png(matr, scale, colors,
+                                           filenames[0])]
+                    if _timings is not None:
+                        count['pixels'] = (matr.width * matr.height *
+                                           scale ** 2 * len(filenames))
+                        count['files'] = len(filenames)
+                        count['bytes'] = sum(map(getsize, filenames))
 
-            filename = f'mapimg_{num}.png'
-            if delta:
-                adds = 's' if delta > 1 else ''
-                advice = f'Add {delta} color{adds} for {filename}.'
-                stderr.write(f'Error: not enough colors. {advice}\n')
+                for filename, delta in zip(filenames, deltas):
+                    if delta:
+                        adds = 's' if delta > 1 else ''
+                        advice = f'Add {delta} color{adds} for {filename}.'
+                        stderr.write(f'Error: not enough colors. {advice}\n')
 
-            print(f'Create image: {getcwd()}{sep}{filename}')
-            image.save(filename)
+                    print(f'Create image: {getcwd()}{sep}{filename}',
+                          flush=True)
+        except (OSError, ValueError, zlib.error) as err:
+            stderr.write(f'Error: {err}\n')
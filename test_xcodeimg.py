@@ -0,0 +1,51 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+Tests for xcodeimg.py.
+
+$ python -m unittest test_xcodeimg
+"""
+
+import os
+import unittest
+from tempfile import TemporaryDirectory
+
+from PIL import Image, ImageDraw
+
+import xcodeimg
+
+
+def files(root):
+    """Return dict {relative path: bytes} for all files in root."""
+    data = dict()
+    for folder, dirs, names in os.walk(root):
+        for name in names:
+            path = os.path.join(folder, name)
+            with open(path, 'rb') as file:
+                data[os.path.relpath(path, root)] = file.read()
+    return data
+
+
+class DeriveTest(unittest.TestCase):
+
+    def test_same_bytes_for_jobs(self):
+        with TemporaryDirectory() as folder:
+            img = Image.new('RGBA', (1024, 1024), (20, 90, 160, 255))
+            draw = ImageDraw.Draw(img)
+            draw.ellipse((100, 200, 900, 800), fill=(250, 200, 0, 255))
+            icon = os.path.join(folder, 'icon.png')
+            img.save(icon)
+            results = []
+            for jobs in (4, 4, 1, 8):
+                root = os.path.join(folder, f'{len(results)}.xcassets')
+                xcodeimg.build(icon, icon, 'i', 'n', root=root, jobs=jobs,
+                               pyramid=xcodeimg.Pyramid(derive=True))
+                results.append(files(root))
+            self.assertTrue(results[0])
+            for i in results[1:]:
+                self.assertEqual(results[0], i)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -18,6 +18,10 @@ File formats ('png', 'gif', 'jpeg', 'jpg', 'tif', 'tiff','psd')
 
 Script create dir Assets.xcassets with AppIcon.appiconset and LaunchImage.launchimage.
 Script create Contents.json files in every dir.
+
+Library: render_assets takes paths, bytes or PIL images and returns
+{path: bytes} of all files without writing them.
+>>> files = render_assets(icon_bytes, launch_image, 'i', 'l')
 """
 
 __version__ = 1.0
@@ -45,663 +49,1198 @@ __version__ = 1.0
 # FROM, OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER
 # DEALINGS IN THE SOFTWARE.
 
+import hashlib
+import io
 import json
 import os
 import sys
-from shutil import rmtree
+import uuid
+from argparse import ArgumentParser
+from collections import OrderedDict, deque
+from concurrent.futures import Future, ProcessPoolExecutor, ThreadPoolExecutor
+from contextlib import contextmanager
+from functools import lru_cache
+from multiprocessing import get_context
+from multiprocessing.shared_memory import SharedMemory
+from shutil import copy2, rmtree
+from threading import Condition, Lock
+from time import perf_counter
 
 from PIL import Image
 
+# same filter as Image.ANTIALIAS
+RESAMPLE = Image.LANCZOS
+ARTWORK = [('iTunesArtwork', (512, 512)), ('iTunesArtwork@2x', (1024, 1024))]
+
+# memory for resized images of one run
+CACHE_LIMIT = 256 * 2 ** 20
+# threads for files and memory for encoded files before write
+WRITERS = 4
+WRITE_LIMIT = 64 * 2 ** 20
+
+# Contents.json of Assets.xcassets
+ASSETS = {
+    'info': {
+        'version': 1,
+        'author': 'xcode'
+    }
+}
+# sets of sizes and Contents.json data (see load_specs)
+SPECS = os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                     'xcodeimg.json')
+# png encode: fast for dev builds, release - smallest lossless file
+PRESETS = {
+    'fast': {'compress_level': 1},
+    'default': {},
+    'release': {'optimize': True}
+}
+# hashes of sources and parameters for every file in Assets.xcassets
+STATE = '.xcodeimg.json'
+
+# source image (on shared memory) and pyramid in process worker
+_source = None
+_shared = None
+_pyramid = None
+_sources_lock = Lock()
+# id of source: [lock for decode, number of users]
+_loading = dict()
 
-def create_image(directory, data, img, type_img):
+TOOL = 'xcodeimg'
+STDERR = sys.stderr
+# json lines with timings of stages (--timings), None - off
+_timings = None
+_timings_path = None
+_timings_lock = Lock()
+
+
+def set_timings(path):
     """
-    create_image(directory, data, img, type_img)
+    set_timings(path)
+
+    take:
+        path: file for json lines with timings, '-' - stderr, None - off
+    return:
+        None
+    """
+    global _timings, _timings_path
+    with _timings_lock:
+        # old file is closed, stderr stays open
+        if _timings is not None and _timings is not STDERR:
+            _timings.close()
+        _timings_path = path
+        if path is None:
+            _timings = None
+        elif path == '-':
+            _timings = STDERR
+        else:
+            _timings = open(path, 'a', buffering=1)
+
+
+@contextmanager
+def timing(stage, **counters):
+    """
+    timing(stage, **counters)
+
+    take:
+        stage: name of stage
+        counters: pixels, colors, bytes, files... (change in with block)
+    return:
+        context manager with dict of counters.
+
+    Write json line with seconds and counters if timings are on.
+    """
+    if _timings is None:
+        yield counters
+        return
+    start = perf_counter()
+    yield counters
+    record = dict(tool=TOOL, stage=stage, pid=os.getpid(),
+                  seconds=round(perf_counter() - start, 6), **counters)
+    with _timings_lock:
+        _timings.write(json.dumps(record) + '\n')
+
+
+class Pyramid:
+    """
+    Pyramid(limit=CACHE_LIMIT, derive=False)
+
+    Cache of cropped and resized images for one run.
+    Key is (source, crop box, size, filter), every level is computed once
+    and old levels are removed when memory is more than limit bytes.
+    With derive=True small sizes are resized from level twice bigger
+    (see _parent_size) instead of full source (faster, not same pixels
+    as without derive, but same for any jobs and order of sizes).
+    Sources are kept only while they have levels (id is not reused).
+    Safe for threads.
+    """
+
+    def __init__(self, limit=CACHE_LIMIT, derive=False):
+        self.limit = limit
+        self.derive = derive
+        self.levels = OrderedDict()
+        # id: [source, number of levels]
+        self.sources = dict()
+        self.used = 0
+        self.lock = Lock()
+
+    def crop(self, img, box):
+        """Return img.crop(box) computed once."""
+        return self._level((id(img), box, None, None),
+                           lambda: img.crop(box), img)
+
+    def resize(self, img, size, box=None, resample=RESAMPLE):
+        """Return img (cropped by box) resized to size computed once."""
+        size = tuple(size)
+        key = (id(img), box, size, resample)
+
+        def make():
+            parent = None
+            if self.derive:
+                if box is None:
+                    parent = _parent_size(size, img.size)
+                else:
+                    parent = _parent_size(size, (box[2] - box[0],
+                                                 box[3] - box[1]))
+            if parent:
+                # computed once or waited for, never skipped
+                src = self.resize(img, parent, box, resample)
+            else:
+                src = img if box is None else self.crop(img, box)
+            return src.resize(size, resample)
+        return self._level(key, make, img)
+
+    def _level(self, key, make, img):
+        with self.lock:
+            future = self.levels.get(key)
+            owner = future is None
+            if owner:
+                future = self.levels[key] = Future()
+                self.sources.setdefault(id(img), [img, 0])[1] += 1
+            else:
+                self.levels.move_to_end(key)
+        if not owner:
+            return future.result()
+
+        try:
+            image = make()
+        except BaseException as err:
+            with self.lock:
+                self._drop(key)
+            future.set_exception(err)
+            raise
+        future.set_result(image)
+        with self.lock:
+            self.used += _nbytes(image)
+            self._evict()
+        return image
+
+    def _evict(self):
+        for key in list(self.levels):
+            if self.used <= self.limit:
+                break
+            future = self.levels[key]
+            if future.done():
+                self._drop(key)
+                if not future.exception():
+                    self.used -= _nbytes(future.result())
+
+    def _drop(self, key):
+        # remove level and source without levels
+        del self.levels[key]
+        source = self.sources[key[0]]
+        source[1] -= 1
+        if not source[1]:
+            del self.sources[key[0]]
+
+
+def _parent_size(size, source):
+    # twice bigger level if it is half of source or less, else None
+    parent = (size[0] * 2, size[1] * 2)
+    if parent[0] * 2 <= source[0] and parent[1] * 2 <= source[1]:
+        return parent
+    return None
+
+
+def _nbytes(img):
+    return img.width * img.height * len(img.getbands())
+
+
+def render_image(img, item, type_img, pyramid=None):
+    """
+    render_image(img, item, type_img, pyramid=None)
 
     take:
-        directory: dir for new images
-        data: json data
         img: PIL image
-        type_img: 'icon' or 'launch'
+        item: image from Contents.json or ('name', (w, h)) for artwork
+        type_img: 'icon', 'launch' or 'artwork'
+        pyramid: Pyramid to share resized images between sizes
+    return:
+        resize: PIL image for one size.
+    """
+    if pyramid is None:
+        pyramid = Pyramid(0)
+
+    if type_img == 'artwork':
+        return pyramid.resize(img, item[1])
+
+    img_res = img
+    if type_img == 'icon':
+        wid, hei = img_res.size
+        c_wid = wid // 2
+        c_hei = hei // 2
+
+        delta = wid // 2
+        if wid > hei:
+            delta = hei // 2
+
+        box = (c_wid - delta, c_hei - delta, c_wid + delta, c_hei + delta)
+        size = pixel_size(item, type_img)
+        if size[0] != size[1]:
+            # not square icons from specs: biggest box with same ratio
+            ratio = min(wid / size[0], hei / size[1])
+            hlf_x = size[0] * ratio / 2
+            hlf_y = size[1] * ratio / 2
+            box = (c_wid - hlf_x, c_hei - hlf_y, c_wid + hlf_x, c_hei + hlf_y)
+
+        resize = pyramid.resize(img_res, size, box)
+    else:
+        # to avoid black parts in small images
+        size = pixel_size(item, type_img)
+        if (1334 in size or 768 in size or 1024 in size or 640 in size):
+            img_res = pyramid.resize(img, (1334, 1334))
+        elif 320 in size:
+            img_res = pyramid.resize(img, (640, 640))
+        else:
+            img_res = pyramid.resize(img, (2208, 2208))
+        wid, hei = img_res.size
+        c_wid = wid // 2
+        c_hei = hei // 2
+        hlf_x = size[0] // 2
+        hlf_y = size[1] // 2
+        resize = img_res.crop((c_wid - hlf_x, c_hei - hlf_y,
+                               c_wid + hlf_x, c_hei + hlf_y))
+    return resize
+
+
+def reduce_colors(img):
+    """
+    reduce_colors(img)
+
+    take:
+        img: PIL image
+    return:
+        img: same pixels in smaller mode - RGB if alpha is opaque,
+             palette if image has up to 256 colors.
+    """
+    if img.mode == 'RGBA' and img.getextrema()[3] == (255, 255):
+        img = img.convert('RGB')
+    if img.mode in ('RGB', 'RGBA') and img.getcolors(256) is not None:
+        palette = img.quantize(256, Image.FASTOCTREE)
+        # keep palette only without changes of pixels
+        if palette.convert(img.mode).tobytes() == img.tobytes():
+            return palette
+    return img
+
+
+def encode_png(img, preset='default'):
+    """
+    encode_png(img, preset='default')
+
+    take:
+        img: PIL image
+        preset: name from PRESETS
+    return:
+        (data, saved): png bytes and bytes saved against default encode.
+    """
+    buffer = io.BytesIO()
+    if preset != 'release':
+        img.save(buffer, 'PNG', **PRESETS[preset])
+        return buffer.getvalue(), 0
+
+    img.save(buffer, 'PNG')
+    base = buffer.getvalue()
+    buffer = io.BytesIO()
+    reduce_colors(img).save(buffer, 'PNG', **PRESETS[preset])
+    data = buffer.getvalue()
+    if len(data) >= len(base):
+        return base, 0
+    return data, len(base) - len(data)
+
+
+def encode_image(img, item, type_img, pyramid=None, preset='default'):
+    """
+    encode_image(img, item, type_img, pyramid=None, preset='default')
+
+    Resize and encode one image. Return (png bytes, saved).
+    """
+    with timing('render', type=type_img) as count:
+        resize = render_image(img, item, type_img, pyramid)
+        count['pixels'] = resize.width * resize.height
+    with timing('encode', type=type_img) as count:
+        data, saved = encode_png(resize, preset)
+        count['bytes'] = len(data)
+    return data, saved
+
+
+def save_image(img, item, type_img, path, pyramid=None, preset='default'):
+    """
+    save_image(img, item, type_img, path, pyramid=None, preset='default')
+
+    Resize and encode one image to path or list of paths (png).
+    Return (bytes, saved).
+    """
+    paths = [path] if isinstance(path, str) else path
+    data, saved = encode_image(img, item, type_img, pyramid, preset)
+    for i in paths:
+        with open(i, 'wb') as file:
+            file.write(data)
+    return len(data), saved
+
+
+class Writer:
+    """
+    Writer(threads=WRITERS, limit=WRITE_LIMIT)
+
+    Files are written by threads while next images are encoded. put
+    waits while more than limit bytes are not written (backpressure).
+    First error of write is raised by put or close.
+    """
+
+    def __init__(self, threads=WRITERS, limit=WRITE_LIMIT):
+        self.limit = limit
+        self.pending = 0
+        self.error = None
+        self._ready = Condition()
+        self._pool = ThreadPoolExecutor(threads)
+
+    def put(self, path, data):
+        size = len(data)
+        with self._ready:
+            # one file bigger than limit is written alone
+            while self.pending and self.pending + size > self.limit:
+                self._ready.wait()
+            if self.error is not None:
+                raise self.error
+            self.pending += size
+        self._pool.submit(self._write, path, data)
+
+    def _write(self, path, data):
+        try:
+            with timing('write', file=path, files=1, bytes=len(data)):
+                with open(path, 'wb') as file:
+                    file.write(data)
+        except OSError as err:
+            with self._ready:
+                self.error = self.error or err
+        finally:
+            with self._ready:
+                self.pending -= len(data)
+                self._ready.notify_all()
+
+    def close(self):
+        self._pool.shutdown()
+        if self.error is not None:
+            raise self.error
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        if exc[0] is None:
+            self.close()
+        else:
+            self._pool.shutdown()
+
+
+def _bounded_map(pool, func, tasks, window):
+    # results in order, not more than window tasks in memory
+    pending = deque()
+    for i in tasks:
+        pending.append(pool.submit(func, *i))
+        if len(pending) >= window:
+            yield pending.popleft().result()
+    while pending:
+        yield pending.popleft().result()
+
+
+@contextmanager
+def share_image(img):
+    """
+    share_image(img)
+
+    take:
+        img: PIL image
+    return:
+        context manager with spec for attach_image, memory is free at exit.
+
+    Pixels of decoded image are copied once to shared memory, process
+    workers read them without pickle and decode.
+    """
+    data = img.tobytes()
+    shared = SharedMemory(create=True, size=max(1, len(data)))
+    try:
+        shared.buf[:len(data)] = data
+        del data
+        palette = None
+        if img.palette is not None:
+            palette = (img.palette.mode, img.palette.tobytes())
+        yield (shared.name, img.mode, img.size, palette, dict(img.info))
+    finally:
+        shared.close()
+        shared.unlink()
+
+
+def attach_image(spec):
+    """
+    attach_image(spec)
+
+    take:
+        spec: from share_image
+    return:
+        (img, shared): PIL image on shared memory (copy for modes without
+                       direct mapping) and SharedMemory to keep open.
+    """
+    name, mode, size, palette, info = spec
+    shared = SharedMemory(name=name)
+    img = Image.frombuffer(mode, size, shared.buf, 'raw', mode, 0, 1)
+    if palette is not None:
+        img.putpalette(palette[1], palette[0])
+    img.info.update(info)
+    return img, shared
+
+
+def _init_worker(spec, limit, derive, timings=None):
+    global _source, _shared, _pyramid
+    _source, _shared = attach_image(spec)
+    _pyramid = Pyramid(limit, derive)
+    set_timings(timings)
+
+
+def _encode_source(item, type_img, preset='default'):
+    return encode_image(_source, item, type_img, _pyramid, preset)
+
+
+def json_text(data):
+    """Return text of Contents.json for data."""
+    # for python3
+    return json.dumps(data, ensure_ascii=False, indent=4,
+                      separators=(',', ': '), sort_keys=True)
+
+
+def write_json(path, data, writer=None):
+    """
+    write_json(path, data, writer=None)
+
+    take:
+        path: path to json file
+        data: json data
+        writer: Writer for file, None - write now
+    return:
+        True if file is changed.
+
+    File with same content is not touched, changed file is new file
+    (not shared with hard link).
+    """
+    text = json_text(data)
+    if os.path.isfile(path):
+        with open(path) as file:
+            if file.read() == text:
+                return False
+        os.remove(path)
+    if writer is not None:
+        writer.put(path, text.encode())
+        return True
+    with open(path, 'w') as file:
+        file.write(text)
+    return True
+
+
+def link_file(src, dst):
+    """
+    link_file(src, dst)
+
+    Hard link src to dst, copy if link is not possible.
+    """
+    try:
+        os.link(src, dst)
+    except OSError:
+        copy2(src, dst)
+
+
+def swap_dir(new, root):
+    """
+    swap_dir(new, root)
+
+    take:
+        new: complete dir
+        root: dir to replace
     return:
         None
 
-    Create images for all sizes from Contents.json.
+    Old root is renamed aside and new dir is renamed to root, so root is
+    old or complete new dir, never half written. Old dir is removed.
+    If new dir can not be renamed, old dir is renamed back to root.
+    """
+    old = None
+    if os.path.exists(root):
+        old = f'{new}.old'
+        os.rename(root, old)
+    try:
+        os.rename(new, root)
+    except BaseException:
+        if old:
+            os.rename(old, root)
+        raise
+    if old:
+        rmtree(old)
+
+
+def file_digest(path):
+    """Return sha1 of file content."""
+    digest = hashlib.sha1()
+    with open(path, 'rb') as file:
+        for chunk in iter(lambda: file.read(2 ** 20), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def image_tasks(directory, data, type_img):
     """
-    if not os.path.isdir(os.getcwd() + os.sep + directory):
-        os.mkdir(os.getcwd() + os.sep + directory)
-    name = 'Contents.json'
-    with open(os.path.join(os.getcwd(), directory, name), 'w') as file:
-        # for python3
-        json.dump(data, file, ensure_ascii=False, indent=4,
-                  separators=(',', ': '), sort_keys=True)
+    image_tasks(directory, data, type_img)
+
+    take:
+        directory: dir for images
+        data: json data
+        type_img: 'icon' or 'launch'
+    return:
+        tasks: list of (item, type_img, path), every filename once.
+    """
+    tasks = []
     # save itunes artwork
     # without png
     if type_img == 'icon':
-        img_res = img
-        for i in [('iTunesArtwork.png', (512, 512)),
-                  ('iTunesArtwork@2x.png', (1024, 1024))]:
-            resize = img_res.resize(i[1], Image.ANTIALIAS)
-            resize.save(os.path.join(os.getcwd(), i[0]))
-            # make without png
-            os.rename(i[0], i[0].split('.')[0])
+        for i in ARTWORK:
+            tasks.append((i, 'artwork',
+                          os.path.join(os.path.dirname(directory), i[0])))
 
+    # same filename has same size, write every file once
+    names = set()
     for i in data['images']:
-        img_res = img
+        if i['filename'] not in names:
+            names.add(i['filename'])
+            path = os.path.join(directory, i['filename'])
+            tasks.append((i, type_img, path))
+    return tasks
+
+
+def create_image(directory, data, img, type_img, jobs=1, processes=False,
+                 pyramid=None, state=None, source='', preset='default',
+                 report=None, previous=None):
+    """
+    create_image(directory, data, img, type_img, jobs=1, processes=False,
+                 pyramid=None, state=None, source='', preset='default',
+                 report=None, previous=None)
+
+    take:
+        directory: dir for new images
+        data: json data
+        img: PIL image
+        type_img: 'icon' or 'launch'
+        jobs: number of workers for resize and save
+        processes: use processes instead of threads
+        pyramid: Pyramid with resized images (new for every call if None)
+        state: dict {path: hash} from last run, files with same hash
+               are not created again (incremental)
+        source: hash of source image for state
+        preset: png encode from PRESETS
+        report: dict {path: {'bytes': n, 'saved': n}} for new files
+        previous: old Assets.xcassets for state, same files are linked
+                  from it (None - same dir)
+    return:
+        stamps: dict {path: hash} for all files if state else None.
+
+    Create images for all sizes from Contents.json.
+    """
+    if not os.path.isdir(directory):
+        os.mkdir(directory)
+
+    if pyramid is None:
+        pyramid = Pyramid()
 
-        if type_img == 'icon':
+    tasks = image_tasks(directory, data, type_img)
 
-            filename = i['filename']
-            wid, hei = img_res.size
-            c_wid = wid // 2
-            c_hei = hei // 2
+    stamps = None
+    if state is not None:
+        # paths relative to Assets.xcassets
+        root = os.path.dirname(directory)
+        stamps = dict()
+        new_tasks = []
+        for i in tasks:
+            params = [__version__, source, i[0], i[1], RESAMPLE,
+                      pyramid.derive, preset]
+            stamp = hashlib.sha1(json.dumps(params).encode()).hexdigest()
+            key = os.path.relpath(i[2], root)
+            old = os.path.join(previous or root, key)
+            if state.get(key) != stamp or not os.path.isfile(old):
+                new_tasks.append(i)
+            elif old != i[2]:
+                link_file(old, i[2])
+            stamps[key] = stamp
+        tasks = new_tasks
+        # same Contents.json stays same file
+        old = os.path.join(previous or root,
+                           os.path.basename(directory), 'Contents.json')
+        new = os.path.join(directory, 'Contents.json')
+        if previous and os.path.isfile(old) and not os.path.exists(new):
+            link_file(old, new)
+    with Writer() as writer:
+        write_json(os.path.join(directory, 'Contents.json'), data, writer)
+        if tasks:
+            _run_tasks(directory, tasks, img, writer, jobs, processes,
+                       pyramid, preset, report)
+    return stamps
 
-            delta = wid // 2
-            if wid > hei:
-                delta = hei // 2
 
-            img_res = img_res.crop((c_wid - delta, c_hei - delta,
-                                    c_wid + delta, c_hei + delta))
-            size = int(float(i['size'].split('x')[0]) *
-                       float(i['scale'].split('x')[0]))
+def _run_tasks(directory, tasks, img, writer, jobs, processes, pyramid,
+               preset, report):
+    # decode once before workers share the image
+    name = getattr(img, 'filename', '')
+    with timing('decode', file=name) as count:
+        load_source(img)
+        count['pixels'] = img.width * img.height
+    # same size is rendered and encoded once for all files
+    tasks = plan_sizes(tasks)
+    encode = [(i[0], i[1]) for i in tasks]
+    with timing('create', file=directory, files=len(tasks)):
 
-            resize = img_res.resize([size, size], Image.ANTIALIAS)
+        def write(results):
+            # encoded files go to writer, next images are encoded
+            for task, (png, saved) in zip(tasks, results):
+                for i in task[2]:
+                    writer.put(i, png)
+                    if report is not None:
+                        report[i] = {'bytes': len(png), 'saved': saved}
+
+        if jobs > 1 and processes:
+            # every process has own pyramid and same decoded pixels;
+            # spawn: fork with writer threads can copy held locks
+            with share_image(img) as spec, ProcessPoolExecutor(
+                    jobs, mp_context=get_context('spawn'),
+                    initializer=_init_worker,
+                    initargs=(spec, pyramid.limit, pyramid.derive,
+                              _timings_path)) as pool:
+                write(_bounded_map(pool, _encode_source,
+                                   [i + (preset,) for i in encode],
+                                   jobs * 2))
+        elif jobs > 1:
+            with ThreadPoolExecutor(jobs) as pool:
+                write(_bounded_map(pool, encode_image,
+                                   [(img,) + i + (pyramid, preset)
+                                    for i in encode], jobs * 2))
         else:
-            filename = i['filename']
-            # to avoid black parts in small images
-            sizex = int(float(i['size'].split('x')[0]) *
-                        float(i['scale'].split('x')[0]))
-            sizey = int(float(i['size'].split('x')[1]) *
-                        float(i['scale'].split('x')[0]))
-            size = (sizex, sizey)
-            if (1334 in size or 768 in size or 1024 in size or 640 in size):
-                img_res = img.resize((1334, 1334), Image.ANTIALIAS)
-            elif 320 in size:
-                img_res = img.resize((640, 640), Image.ANTIALIAS)
-            else:
-                img_res = img.resize((2208, 2208), Image.ANTIALIAS)
-            wid, hei = img_res.size
-            c_wid = wid // 2
-            c_hei = hei // 2
-            hlf_x = size[0] // 2
-            hlf_y = size[1] // 2
-            resize = img_res.crop((c_wid - hlf_x, c_hei - hlf_y,
-                                   c_wid + hlf_x, c_hei + hlf_y))
+            write(encode_image(img, *i, pyramid, preset) for i in encode)
+
+
+@lru_cache(maxsize=None)
+def load_specs(path=SPECS):
+    """
+    load_specs(path=SPECS)
+
+    take:
+        path: json file with sets of sizes
+            {"appicon": {"m": {"name": "Mac", "contents": {...}}},
+             "launchimage": {"l": {"name": "iPhone/iPad",
+                                   "contents": {...}}}}
+            contents - data of Contents.json
+    return:
+        specs: dict (read only), every file is read once.
+    """
+    with open(path) as file:
+        return json.load(file)
+
+
+def app_contents(typeic, specs=None):
+    """
+    app_contents(typeic, specs=None)
+
+    take:
+        typeic: AppIcon Mac(m), iPhone/iPad(i), Apple Watch(w) or other
+                key of specs
+        specs: path to json with sizes, None - SPECS
+    return:
+        data: Contents.json data or None
+    """
+    item = load_specs(specs or SPECS)['appicon'].get(typeic)
+    return item['contents'] if item else None
+
+
+def launch_contents(typelnc, specs=None):
+    """
+    launch_contents(typelnc, specs=None)
+
+    take:
+        typelnc: LaunchImage(l) or other key of specs
+        specs: path to json with sizes, None - SPECS
+    return:
+        data: Contents.json data or None
+    """
+    item = load_specs(specs or SPECS)['launchimage'].get(typelnc)
+    return item['contents'] if item else None
+
+
+def pixel_size(item, type_img):
+    """
+    pixel_size(item, type_img)
+
+    take:
+        item: image from Contents.json or ('name', (w, h)) for artwork
+        type_img: 'icon', 'launch' or 'artwork'
+    return:
+        (w, h): size of file in pixels.
+    """
+    if type_img == 'artwork':
+        return tuple(item[1])
+    wid, hei = item['size'].split('x')
+    scale = float(item['scale'].split('x')[0])
+    return int(float(wid) * scale), int(float(hei) * scale)
+
+
+def plan_sizes(tasks):
+    """
+    plan_sizes(tasks)
 
-        resize.save(os.path.join(os.getcwd(), directory, filename))
+    take:
+        tasks: list of (item, type_img, path)
+    return:
+        plan: list of (item, type_img, paths), one render and encode for
+              every type and pixel size, same png for all paths.
+    """
+    plan = dict()
+    for item, type_img, path in tasks:
+        key = (type_img, pixel_size(item, type_img))
+        if key in plan:
+            plan[key][2].append(path)
+        else:
+            plan[key] = (item, type_img, [path])
+    return list(plan.values())
+
+
+def load_image(img):
+    """
+    load_image(img)
+
+    take:
+        img: path, file object, bytes or PIL image
+    return:
+        img: PIL image.
+    """
+    if isinstance(img, Image.Image):
+        return img
+    if isinstance(img, (bytes, bytearray, memoryview)):
+        return Image.open(io.BytesIO(img))
+    return Image.open(img)
 
 
-def main(images):
+def render_assets(image_app, image_launch=None, typeic='i', typelnc='l',
+                  jobs=1, pyramid=None, preset='default', specs=None):
     """
-    main(images)
+    render_assets(image_app, image_launch=None, typeic='i', typelnc='l',
+                  jobs=1, pyramid=None, preset='default', specs=None)
+
+    take:
+        image_app: icon as path, file object, bytes or PIL image
+        image_launch: launch image like image_app, None - image_app
+        typeic: AppIcon Mac(m), iPhone/iPad(i), Apple Watch(w), No(n)
+                or other key of specs
+        typelnc: LaunchImage(l), No(n) or other key of specs
+        jobs: number of threads for resize and encode
+        pyramid: Pyramid with resized images (new for every call if None)
+        preset: png encode from PRESETS
+        specs: path to json with sizes, None - SPECS
+    return:
+        files: dict {path in Assets.xcassets: bytes} with png images and
+               Contents.json files.
+
+    Library version of build: no files, no input and no change of
+    current dir.
+    """
+    if pyramid is None:
+        pyramid = Pyramid()
+    image_app = load_image(image_app)
+    image_launch = image_app if image_launch is None else \
+        load_image(image_launch)
+    # decode before threads share images
+    load_source(image_app)
+    load_source(image_launch)
+
+    files = dict()
+    tasks = []
+    for directory, data, img, type_img in (
+            ('AppIcon.appiconset', app_contents(typeic, specs), image_app,
+             'icon'),
+            ('LaunchImage.launchimage', launch_contents(typelnc, specs),
+             image_launch, 'launch')):
+        if data:
+            files[os.path.join(directory, 'Contents.json')] = \
+                json_text(data).encode()
+            tasks.extend((img,) + i for i in plan_sizes(
+                image_tasks(directory, data, type_img)))
+    if not files:
+        return files
+    files['Contents.json'] = json_text(ASSETS).encode()
+
+    def encode(task):
+        return encode_image(task[0], task[1], task[2], pyramid, preset)[0]
+
+    with ThreadPoolExecutor(max(1, jobs)) as pool:
+        for task, png in zip(tasks, pool.map(encode, tasks)):
+            for i in task[3]:
+                files[i] = png
+    return files
+
+
+def open_image(path, sources=None):
+    """
+    open_image(path, sources=None)
+
+    take:
+        path: path to image
+        sources: dict for decoded images shared between calls
+    return:
+        img: PIL image, same object for same file.
+
+    Image is decoded by create_image only if it has something to do.
+    """
+    path = os.path.realpath(path)
+    if sources is None:
+        sources = dict()
+    with _sources_lock:
+        img = sources.get(path)
+        if img is None:
+            img = sources[path] = Image.open(path)
+    return img
+
+
+def load_source(img):
+    """
+    load_source(img)
+
+    take:
+        img: PIL image
+    return:
+        None
+
+    Decode image once. Lock is only for this image, other sources are
+    decoded at the same time.
+    """
+    key = id(img)
+    with _sources_lock:
+        lock = _loading.setdefault(key, [Lock(), 0])
+        lock[1] += 1
+    try:
+        with lock[0]:
+            img.load()
+    finally:
+        with _sources_lock:
+            lock[1] -= 1
+            if not lock[1]:
+                del _loading[key]
+
+
+def build(image_app, image_launch, typeic='i', typelnc='l',
+          root='Assets.xcassets', jobs=1, processes=False, pyramid=None,
+          sources=None, incremental=False, preset='default', report=None,
+          specs=None):
+    """
+    build(image_app, image_launch, typeic='i', typelnc='l',
+          root='Assets.xcassets', jobs=1, processes=False, pyramid=None,
+          sources=None, incremental=False, preset='default', report=None,
+          specs=None)
+
+    take:
+        image_app: path to icon image
+        image_launch: path to launch image
+        typeic: AppIcon Mac(m), iPhone/iPad(i), Apple Watch(w), No(n)
+                or other key of specs
+        typelnc: LaunchImage(l), No(n) or other key of specs
+        root: dir for assets (Assets.xcassets)
+        jobs: number of workers for every set of images
+        processes: use processes instead of threads
+        pyramid: Pyramid with resized images for all sets
+        sources: dict with decoded images shared between builds
+        incremental: keep files with same source and parameters
+        preset: png encode from PRESETS
+        report: dict {path: {'bytes': n, 'saved': n}} for new files
+        specs: path to json with sizes, None - SPECS
+    return:
+        None
+
+    Call create_image for every image without input and without change
+    of current dir. Files are created in new dir near root, it replaces
+    root at the end (old root is used by incremental build).
+    """
+    content_app = app_contents(typeic, specs)
+    content_lch = launch_contents(typelnc, specs)
+    # same file for icon and launch is decoded once
+    if sources is None:
+        sources = dict()
+
+    all_images = []
+    if content_app:
+        all_images.append(('AppIcon.appiconset', content_app, image_app,
+                           'icon'))
+    if content_lch:
+        all_images.append(('LaunchImage.launchimage', content_lch,
+                           image_launch, 'launch'))
+    if not all_images:
+        if os.path.isdir(root):
+            rmtree(root)
+        return
+
+    state = None
+    previous = None
+    if incremental and os.path.isdir(root):
+        previous = root
+        state = dict()
+        if os.path.isfile(os.path.join(root, STATE)):
+            with open(os.path.join(root, STATE)) as file:
+                state = json.load(file)
+    elif incremental:
+        state = dict()
+
+    # unique dir for every build, other builds do not see it
+    parent, base = os.path.split(os.path.abspath(root))
+    new_root = os.path.join(parent, f'.{base}.{uuid.uuid4().hex}.tmp')
+    os.mkdir(new_root)
+    try:
+        name = 'Contents.json'
+        if previous and os.path.isfile(os.path.join(previous, name)):
+            link_file(os.path.join(previous, name),
+                      os.path.join(new_root, name))
+        write_json(os.path.join(new_root, name), ASSETS)
+
+        stamps = dict()
+        files = None if report is None else dict()
+        for directory, data, image, type_img in all_images:
+            source = file_digest(image) if incremental else ''
+            new = create_image(os.path.join(new_root, directory), data,
+                               open_image(image, sources), type_img,
+                               jobs=jobs, processes=processes,
+                               pyramid=pyramid, state=state, source=source,
+                               preset=preset, report=files,
+                               previous=previous)
+            if incremental:
+                stamps.update(new)
+        if incremental:
+            write_json(os.path.join(new_root, STATE), stamps)
+        if report is not None:
+            # paths in root after swap
+            for i in files:
+                report[os.path.join(root, os.path.relpath(i, new_root))] = \
+                    files[i]
+        swap_dir(new_root, root)
+    except BaseException:
+        rmtree(new_root, ignore_errors=True)
+        raise
+    print('Create iconset:', os.path.realpath(root))
+
+
+def main(images, jobs=1, processes=False, pyramid=None, incremental=False,
+         preset='default', report=None, specs=None):
+    """
+    main(images, jobs=1, processes=False, pyramid=None, incremental=False,
+         preset='default', report=None, specs=None)
 
     take:
         images: icon.* and\or launch.*
+        jobs: number of workers for every set of images
+        processes: use processes instead of threads
+        pyramid: Pyramid with resized images for all sets
+        incremental: create only new or changed files
+        preset: png encode from PRESETS
+        report: dict {path: {'bytes': n, 'saved': n}} for new files
+        specs: path to json with sizes, None - SPECS
 
     return:
         None
 
-    Wait for user input and call create_image for every image.
+    Wait for user input and call build for every image.
     """
     if len(images) > 1:
         image_app, image_launch = images[0], images[1]
     else:
         image_app, image_launch = images[0], images[0]
 
-    img_app = Image.open(os.path.realpath(image_app))
-    typeic = input('AppIcon: Mac(m), iPhone/iPad(i), Apple Watch(w), No(n): '
-                   ).lower() or 'i'
-
-    if typeic == 'm':
-        print('Create AppIcon for Mac.')
-        content_app = {
-            'images': [
-                {
-                    'idiom': 'mac',
-                    'filename': 'icon_16x16.png',
-                    'size': '16x16',
-                    'scale': '1x'
-                },
-                {
-                    'idiom': 'mac',
-                    'filename': 'icon_16x16@2x.png',
-                    'size': '16x16',
-                    'scale': '2x'
-                },
-                {
-                    'idiom': 'mac',
-                    'filename': 'icon_32x32.png',
-                    'size': '32x32',
-                    'scale': '1x'
-                },
-                {
-                    'idiom': 'mac',
-                    'filename': 'icon_32x32@2x.png',
-                    'size': '32x32',
-                    'scale': '2x'
-                },
-                {
-                    'idiom': 'mac',
-                    'filename': 'icon_128x128.png',
-                    'size': '128x128',
-                    'scale': '1x'
-                },
-                {
-                    'idiom': 'mac',
-                    'filename': 'icon_128x128@2x.png',
-                    'size': '128x128',
-                    'scale': '2x'
-                },
-                {
-                    'idiom': 'mac',
-                    'filename': 'icon_256x256.png',
-                    'size': '256x256',
-                    'scale': '1x'
-                },
-                {
-                    'idiom': 'mac',
-                    'filename': 'icon_256x256@2x.png',
-                    'size': '256x256',
-                    'scale': '2x'
-                },
-                {
-                    'idiom': 'mac',
-                    'filename': 'icon_512x512.png',
-                    'size': '512x512',
-                    'scale': '1x'
-                },
-                {
-                    'idiom': 'mac',
-                    'filename': 'icon_512x512@2x.png',
-                    'size': '512x512',
-                    'scale': '2x'
-                }
-            ],
-            'info': {
-                'version': 1,
-                'author': 'xcode'
-            }
-        }
-    elif typeic == 'i':
-        print('Create AppIcon for iPhone/iPad.')
-        content_app = {
-            'images': [
-                {
-                    'size': '20x20',
-                    'idiom': 'iphone',
-                    'filename': 'Icon-Notification@2x.png',
-                    'scale': '2x'
-                },
-                {
-                    'size': '20x20',
-                    'idiom': 'iphone',
-                    'filename': 'Icon-Notification@3x.png',
-                    'scale': '3x'
-                },
-                {
-                    'size': '29x29',
-                    'idiom': 'iphone',
-                    'filename': 'Icon-Small.png',
-                    'scale': '1x'
-                },
-                {
-                    'size': '29x29',
-                    'idiom': 'iphone',
-                    'filename': 'Icon-Small@2x.png',
-                    'scale': '2x'
-                },
-                {
-                    'size': '29x29',
-                    'idiom': 'iphone',
-                    'filename': 'Icon-Small@3x.png',
-                    'scale': '3x'
-                },
-                {
-                    'size': '57x57',
-                    'idiom': 'iphone',
-                    'filename': 'Icon.png',
-                    'scale': '1x'
-                },
-                {
-                    'size': '57x57',
-                    'idiom': 'iphone',
-                    'filename': 'Icon@2x.png',
-                    'scale': '2x'
-                },
-
-                {
-                    'size': '40x40',
-                    'idiom': 'iphone',
-                    'filename': 'Icon-Small-40@2x.png',
-                    'scale': '2x'
-                },
-                {
-                    'size': '40x40',
-                    'idiom': 'iphone',
-                    'filename': 'Icon-Small-40@3x.png',
-                    'scale': '3x'
-                },
-                {
-                    'size': '60x60',
-                    'idiom': 'iphone',
-                    'filename': 'Icon-60@2x.png',
-                    'scale': '2x'
-                },
-                {
-                    'size': '60x60',
-                    'idiom': 'iphone',
-                    'filename': 'Icon-60@3x.png',
-                    'scale': '3x'
-                },
-
-                {
-                    'size': '20x20',
-                    'idiom': 'ipad',
-                    'filename': 'Icon-Notification.png',
-                    'scale': '1x'
-                },
-                {
-                    'size': '20x20',
-                    'idiom': 'ipad',
-                    'filename': 'Icon-Notification@2x.png',
-                    'scale': '2x'
-                },
-                {
-                    'size': '29x29',
-                    'idiom': 'ipad',
-                    'filename': 'Icon-Small.png',
-                    'scale': '1x'
-                },
-                {
-                    'size': '29x29',
-                    'idiom': 'ipad',
-                    'filename': 'Icon-Small@2x.png',
-                    'scale': '2x'
-                },
-                {
-                    'size': '40x40',
-                    'idiom': 'ipad',
-                    'filename': 'Icon-Small-40.png',
-                    'scale': '1x'
-                },
-                {
-                    'size': '40x40',
-                    'idiom': 'ipad',
-                    'filename': 'Icon-Small-40@2x.png',
-                    'scale': '2x'
-                },
-                {
-                    'size': '50x50',
-                    'idiom': 'ipad',
-                    'filename': 'Icon-Small-50.png',
-                    'scale': '1x'
-                },
-                {
-                    'size': '50x50',
-                    'idiom': 'ipad',
-                    'filename': 'Icon-Small-50@2x.png',
-                    'scale': '2x'
-                },
-                {
-                    'size': '72x72',
-                    'idiom': 'ipad',
-                    'filename': 'Icon-72.png',
-                    'scale': '1x'
-                },
-                {
-                    'size': '72x72',
-                    'idiom': 'ipad',
-                    'filename': 'Icon-72@2x.png',
-                    'scale': '2x'
-                },
-                {
-                    'size': '76x76',
-                    'idiom': 'ipad',
-                    'filename': 'Icon-76.png',
-                    'scale': '1x'
-                },
-                {
-                    'size': '76x76',
-                    'idiom': 'ipad',
-                    'filename': 'Icon-76@2x.png',
-                    'scale': '2x'
-                },
-                {
-                    'size': '83.5x83.5',
-                    'idiom': 'ipad',
-                    'filename': 'Icon-83.5@2x.png',
-                    'scale': '2x'
-                }
-            ],
-            'info': {
-                'version': 1,
-                'author': 'xcode'
-            }
-        }
-    elif typeic == 'w':
-        print('Create AppIcon for Apple Watch.')
-        content_app = {
-            'images': [
-                {
-                    'size': '24x24',
-                    'idiom': 'watch',
-                    'scale': '2x',
-                    'filename': 'icon-watch-24@2x.png',
-                    'role': 'notificationCenter',
-                    'subtype': '38mm'
-                },
-                {
-                    'size': '27.5x27.5',
-                    'idiom': 'watch',
-                    'scale': '2x',
-                    'filename': 'icon-watch-27.5@2x.png',
-                    'role': 'notificationCenter',
-                    'subtype': '42mm'
-                },
-                {
-                    'size': '29x29',
-                    'idiom': 'watch',
-                    'filename': 'icon-watch-29@2x.png',
-                    'role': 'companionSettings',
-                    'scale': '2x'
-                },
-                {
-                    'size': '29x29',
-                    'idiom': 'watch',
-                    'filename': 'icon-watch-29@3x.png',
-                    'role': 'companionSettings',
-                    'scale': '3x'
-                },
-                {
-                    'size': '40x40',
-                    'idiom': 'watch',
-                    'scale': '2x',
-                    'filename': 'icon-watch-40@2x.png',
-                    'role': 'appLauncher',
-                    'subtype': '38mm'
-                },
-                {
-                    'size': '44x44',
-                    'idiom': 'watch',
-                    'scale': '2x',
-                    'filename': 'icon-watch-44@2x.png',
-                    'role': 'longLook',
-                    'subtype': '42mm'
-                },
-                {
-                    'size': '86x86',
-                    'idiom': 'watch',
-                    'scale': '2x',
-                    'filename': 'icon-watch-86@2x.png',
-                    'role': 'quickLook',
-                    'subtype': '38mm'
-                },
-                {
-                    'size': '98x98',
-                    'idiom': 'watch',
-                    'scale': '2x',
-                    'filename': 'icon-watch-98@2x.png',
-                    'role': 'quickLook',
-                    'subtype': '42mm'
-                }
-            ],
-            'info': {
-                'version': 1,
-                'author': 'xcode'
-            }
-        }
+    # questions from sets of sizes
+    table = load_specs(specs or SPECS)
+    apps = table['appicon']
+    launches = table['launchimage']
+    names = ', '.join(f'{apps[i]["name"]}({i})' for i in apps)
+    typeic = input(f'AppIcon: {names}, No(n): ').lower() or 'i'
+    if typeic in apps:
+        print(f'Create AppIcon for {apps[typeic]["name"]}.')
     else:
         print('No AppIcon.')
         typeic = 'n'
 
-    img_lch = Image.open(os.path.realpath(image_launch))
-
-    typelnc = input('LaunchImage(l), No(n): ').lower() or 'l'
-
-    if typelnc == 'l':
-        print('Create LaunchImage for iPhone/iPad.')
-        content_lch = {
-            'images': [
-                {
-                    'size': '320x480',
-                    'orientation': 'portrait',
-                    'idiom': 'iphone',
-                    'filename': 'Default.png',
-                    'extent': 'full-screen',
-                    'scale': '1x'
-                },
-                {
-                    'size': '320x480',
-                    'orientation': 'portrait',
-                    'idiom': 'iphone',
-                    'filename': 'Default@2x.png',
-                    'extent': 'full-screen',
-                    'scale': '2x'
-                },
-                {
-                    'size': '320x568',
-                    'orientation': 'portrait',
-                    'idiom': 'iphone',
-                    'filename': 'Default-568h@2x.png',
-                    'extent': 'full-screen',
-                    'subtype': 'retina4',
-                    'scale': '2x'
-                },
-                {
-                    'size': '768x1004',
-                    'orientation': 'portrait',
-                    'idiom': 'ipad',
-                    'filename': 'Portrait-status.png',
-                    'extent': 'to-status-bar',
-                    'scale': '1x'
-                },
-                {
-                    'size': '768x1024',
-                    'orientation': 'portrait',
-                    'idiom': 'ipad',
-                    'filename': 'Portrait.png',
-                    'extent': 'full-screen',
-                    'scale': '1x'
-                },
-                {
-                    'size': '1024x748',
-                    'orientation': 'landscape',
-                    'idiom': 'ipad',
-                    'filename': 'Landscape-status.png',
-                    'extent': 'to-status-bar',
-                    'scale': '1x'
-                },
-                {
-                    'size': '1024x768',
-                    'orientation': 'landscape',
-                    'idiom': 'ipad',
-                    'filename': 'Landscape.png',
-                    'extent': 'full-screen',
-                    'scale': '1x'
-                },
-                {
-                    'size': '768x1004',
-                    'orientation': 'portrait',
-                    'idiom': 'ipad',
-                    'filename': 'Landscape-status@2x.png',
-                    'extent': 'to-status-bar',
-                    'scale': '2x'
-                },
-                {
-                    'size': '768x1024',
-                    'orientation': 'portrait',
-                    'idiom': 'ipad',
-                    'filename': 'Portrait@2x.png',
-                    'extent': 'full-screen',
-                    'scale': '2x'
-                },
-                {
-                    'size': '1024x748',
-                    'orientation': 'landscape',
-                    'idiom': 'ipad',
-                    'filename': 'Portrait-status@2x.png',
-                    'extent': 'to-status-bar',
-                    'scale': '2x'
-                },
-                {
-                    'size': '1024x768',
-                    'orientation': 'landscape',
-                    'idiom': 'ipad',
-                    'filename': 'Landscape@2x.png',
-                    'extent': 'full-screen',
-                    'scale': '2x'
-                },
-                {
-                    'size': '414x736',
-                    'extent': 'full-screen',
-                    'idiom': 'iphone',
-                    'subtype': '736h',
-                    'filename': 'Default-736h@3x.png',
-                    'minimum-system-version': '8.0',
-                    'orientation': 'portrait',
-                    'scale': '3x'
-                },
-                {
-                    'size': '736x414',
-                    'extent': 'full-screen',
-                    'idiom': 'iphone',
-                    'subtype': '736h',
-                    'filename': 'Default-Landscape-736h@3x.png',
-                    'minimum-system-version': '8.0',
-                    'orientation': 'landscape',
-                    'scale': '3x'
-                },
-                {
-                    'size': '375x667',
-                    'extent': 'full-screen',
-                    'idiom': 'iphone',
-                    'subtype': '667h',
-                    'filename': 'Default-667h@2x.png',
-                    'minimum-system-version': '8.0',
-                    'orientation': 'portrait',
-                    'scale': '2x'
-                },
-                {
-                    'size': '320x480',
-                    'orientation': 'portrait',
-                    'idiom': 'iphone',
-                    'filename': 'Default@2x.png',
-                    'extent': 'full-screen',
-                    'minimum-system-version': '7.0',
-                    'scale': '2x'
-                },
-                {
-                    'size': '320x568',
-                    'orientation': 'portrait',
-                    'idiom': 'iphone',
-                    'subtype': 'retina4',
-                    'filename': 'Default-568h@2x.png',
-                    'extent': 'full-screen',
-                    'minimum-system-version': '7.0',
-                    'scale': '2x'
-                },
-                {
-                    'size': '768x1024',
-                    'orientation': 'portrait',
-                    'idiom': 'ipad',
-                    'filename': 'Portrait.png',
-                    'extent': 'full-screen',
-                    'minimum-system-version': '7.0',
-                    'scale': '1x'
-                },
-                {
-                    'size': '1024x768',
-                    'orientation': 'landscape',
-                    'idiom': 'ipad',
-                    'filename': 'Landscape.png',
-                    'extent': 'full-screen',
-                    'minimum-system-version': '7.0',
-                    'scale': '1x'
-                },
-                {
-                    'size': '768x1024',
-                    'orientation': 'portrait',
-                    'idiom': 'ipad',
-                    'filename': 'Portrait@2x.png',
-                    'extent': 'full-screen',
-                    'minimum-system-version': '7.0',
-                    'scale': '2x'
-                },
-                {
-                    'size': '1024x768',
-                    'orientation': 'landscape',
-                    'idiom': 'ipad',
-                    'filename': 'Landscape@2x.png',
-                    'extent': 'full-screen',
-                    'minimum-system-version': '7.0',
-                    'scale': '2x'
-                }
-            ],
-            'info': {
-                'version': 1,
-                'author': 'xcode'
-            }
-        }
-
+    names = '/'.join(launches)
+    typelnc = input(f'LaunchImage({names}), No(n): ').lower() or 'l'
+    if typelnc in launches:
+        print(f'Create LaunchImage for {launches[typelnc]["name"]}.')
     else:
         print('No LaunchImage.')
-
         typelnc = 'n'
 
-    new_dir = 'Assets.xcassets'
-    if not os.path.isdir(os.getcwd() + os.sep + new_dir):
-        os.mkdir(os.getcwd() + os.sep + new_dir)
-
-    os.chdir(new_dir)
-    root = os.getcwd()
-    # clean dir
-    files = os.listdir()
-    for i in range(len(files)):
-        if os.path.isdir(files[i]):
-            os.chdir(files[i])
-            rmtree(os.getcwd())
-            os.chdir(root)
-        else:
-            os.remove(files[i])
+    build(image_app, image_launch, typeic, typelnc, jobs=jobs,
+          processes=processes, pyramid=pyramid, incremental=incremental,
+          preset=preset, report=report, specs=specs)
 
-    assets = {
-        'info': {
-            'version': 1,
-            'author': 'xcode'
-        }
-    }
-    name = 'Contents.json'
-    with open(os.path.join(os.getcwd(), name), 'w') as file:
-        # for python3
-        json.dump(assets, file, ensure_ascii=False, indent=4,
-                  separators=(',', ': '), sort_keys=True)
 
-    all_images = []
-    if typeic != 'n':
-        all_images.append(('AppIcon.appiconset',
-                           content_app, img_app, 'icon'))
-    if typelnc != 'n':
-        all_images.append(('LaunchImage.launchimage',
-                           content_lch, img_lch, 'launch'))
-    if len(all_images) > 0:
-        for i in all_images:
-            create_image(*i)
-        print('Create iconset:', os.getcwd())
+def load_manifest(manifest):
+    """
+    load_manifest(manifest)
+
+    take:
+        manifest: path to json or toml file
+            {"apps": [{"icon": "icon.png", "launch": "launch.png",
+                       "appicon": "i", "launchimage": "l",
+                       "output": "App/Assets.xcassets"}]}
+    return:
+        apps: list of dicts with paths relative to current dir.
+
+    launch is icon if empty, appicon is 'i' and launchimage is 'l' by
+    default, output is Assets.xcassets near manifest.
+    """
+    if manifest.lower().endswith('.toml'):
+        import tomllib
+        with open(manifest, 'rb') as file:
+            data = tomllib.load(file)
     else:
-        # clean dir
-        rmtree(os.getcwd())
+        with open(manifest) as file:
+            data = json.load(file)
+
+    base = os.path.dirname(os.path.realpath(manifest))
+    apps = []
+    for i in data['apps']:
+        icon = os.path.join(base, i['icon'])
+        apps.append({
+            'icon': icon,
+            'launch': os.path.join(base, i.get('launch') or icon),
+            'appicon': i.get('appicon', 'i').lower(),
+            'launchimage': i.get('launchimage', 'l').lower(),
+            'output': os.path.join(base, i.get('output', 'Assets.xcassets'))
+        })
+    outputs = [os.path.realpath(i['output']) for i in apps]
+    if len(set(outputs)) < len(outputs):
+        raise ValueError('same output for different apps')
+    return apps
+
+
+def write_report(path, report):
+    """
+    write_report(path, report)
+
+    take:
+        path: json file for report, None - only total in stdout
+        report: dict {path: {'bytes': n, 'saved': n}}
+    return:
+        None
+    """
+    total = sum(i['bytes'] for i in report.values())
+    saved = sum(i['saved'] for i in report.values())
+    print(f'PNG: {len(report)} files, {total} bytes, saved {saved} bytes.')
+    if path:
+        with open(path, 'w') as file:
+            json.dump(report, file, indent=4, sort_keys=True)
+
+
+def batch(manifest, jobs=1, processes=False, pyramid=None,
+          incremental=False, preset='default', report=None, specs=None):
+    """
+    batch(manifest, jobs=1, processes=False, pyramid=None,
+          incremental=False, preset='default', report=None, specs=None)
+
+    take:
+        manifest: path to json or toml file with apps (see load_manifest)
+        jobs: number of apps in parallel (workers in every app
+              with processes)
+        processes: use processes pool in every app, apps one by one
+        pyramid: Pyramid with resized images for all apps
+        incremental: create only new or changed files
+        preset: png encode from PRESETS
+        report: dict {path: {'bytes': n, 'saved': n}} for new files
+        specs: path to json with sizes, None - SPECS
+    return:
+        None
+
+    Build all apps in one process without input. Same source images are
+    decoded once and resized once for all apps.
+    """
+    apps = load_manifest(manifest)
+    sources = dict()
+    if pyramid is None:
+        pyramid = Pyramid()
+
+    def build_app(app):
+        build(app['icon'], app['launch'], app['appicon'], app['launchimage'],
+              app['output'], jobs=jobs if processes else 1,
+              processes=processes, pyramid=pyramid, sources=sources,
+              incremental=incremental, preset=preset, report=report,
+              specs=specs)
+
+    if jobs > 1 and not processes:
+        with ThreadPoolExecutor(jobs) as pool:
+            list(pool.map(build_app, apps))
+    else:
+        for i in apps:
+            build_app(i)
 
 
 if __name__ == '__main__':
+    parser = ArgumentParser(description='Create Xcode icons.')
+    parser.add_argument('images', nargs='*', help='icon and launch images')
+    parser.add_argument('-j', '--jobs', type=int, default=os.cpu_count(),
+                        help='workers for resize and save')
+    parser.add_argument('--processes', action='store_true',
+                        help='use processes instead of threads')
+    parser.add_argument('--cache', type=int, default=CACHE_LIMIT // 2 ** 20,
+                        help='memory for resized images (MB)')
+    parser.add_argument('--derive', action='store_true',
+                        help='resize small sizes from twice bigger sizes')
+    parser.add_argument('--batch', metavar='MANIFEST',
+                        help='json/toml file with apps, without input')
+    parser.add_argument('-i', '--incremental', action='store_true',
+                        help='create only new or changed files')
+    parser.add_argument('--timings', metavar='FILE',
+                        help='json lines with time of stages, - for stderr')
+    parser.add_argument('--png', choices=PRESETS, default='default',
+                        help='png encode: fast (dev), release (smallest)')
+    parser.add_argument('--report', metavar='FILE',
+                        help='json with bytes and saved bytes of files')
+    parser.add_argument('--specs', metavar='JSON',
+                        help='sets of sizes instead of xcodeimg.json')
+    args = parser.parse_args()
+    set_timings(args.timings)
+    pyramid = Pyramid(args.cache * 2 ** 20, args.derive)
+    report = dict() if args.report or args.png == 'release' else None
+
     print('Xcode iconset.')
+    if args.batch:
+        batch(args.batch, args.jobs, args.processes, pyramid,
+              args.incremental, args.png, report, args.specs)
+        if report is not None:
+            write_report(args.report, report)
+        sys.exit()
+
     img = []
     type_img = ('.png', '.gif', '.jpeg', '.jpg', '.tif', '.tiff', '.psd')
-    if len(sys.argv) > 1:
-        for i in [i for i in sys.argv[1:3] if os.path.isfile(i)]:
+    if args.images:
+        for i in [i for i in args.images[:2] if os.path.isfile(i)]:
             extens = os.path.splitext(i)[-1].lower()
             if extens in type_img:
                 img.append(i)
 
-    elif len(sys.argv) == 1:
+    else:
         for i in [i for i in os.listdir() if os.path.isfile(i)]:
             extens = os.path.splitext(i)[-1].lower()
 
@@ -710,7 +1249,10 @@ if __name__ == '__main__':
                 img.append(i)
 
     if len(img) > 0:
-        main(img)
+        main(img, args.jobs, args.processes, pyramid, args.incremental,
+             args.png, report, args.specs)
+        if report is not None:
+            write_report(args.report, report)
     else:
         print('Error: Enter correct path.', end=' ')
         print('Put "icon.*" or "launch.*" image in current dir.')